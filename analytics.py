@@ -4,10 +4,168 @@ Tracks community engagement, top contributors, and content reach metrics.
 """
 
 from firebase_admin import db
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-from collections import defaultdict, Counter
+from datetime import datetime, date, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from collections import defaultdict, namedtuple, Counter
+from concurrent.futures import ThreadPoolExecutor
+import atexit
 import json
+import queue
+import re
+import threading
+import time
+
+import numpy as np
+
+from push_keys import generate_push_key
+from ttl_cache import TTLCache
+
+
+# ============================================================
+# Query Cache
+# ============================================================
+
+# Two-tier TTL: finished days never change, today's bucket still does.
+HISTORICAL_TTL_SECONDS = 24 * 60 * 60
+CURRENT_TTL_SECONDS = 300
+_MAX_CACHE_ENTRIES = 4096
+
+_analytics_cache = TTLCache(_MAX_CACHE_ENTRIES)  # {key: value}; shared by _read_executor threads
+
+# Shared pool for fanning out independent RTDB reads
+_read_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="analytics-read")
+
+# Distinguishes "not cached" from a cached None
+_MISSING = object()
+
+
+def _cached(key: tuple, ttl: float, loader: Callable[[], object]):
+    """Return the cached value for `key`, calling `loader` when missing or expired."""
+    cached = _analytics_cache.get(key, _MISSING)
+    if cached is not _MISSING:
+        return cached
+    
+    value = loader()
+    _analytics_cache.set(key, value, ttl)
+    return value
+
+
+# ============================================================
+# Background Write Queue
+# ============================================================
+
+# Tracking writes are queued and flushed by a daemon thread so callers
+# never wait on an RTDB round-trip. Each flush is one multi-path update;
+# counters ride along as server-side increments.
+_WRITE_BATCH_SIZE = 500
+_WRITE_QUEUE_MAXSIZE = 10000
+
+# A failed batch is retried in place, then re-queued after a pause
+_WRITE_FLUSH_ATTEMPTS = 3
+_WRITE_RETRY_BACKOFF_SECONDS = 0.5
+_WRITE_REQUEUE_DELAY_SECONDS = 5
+
+_write_queue: "queue.Queue[Optional[Tuple[str, str, object]]]" = queue.Queue(maxsize=_WRITE_QUEUE_MAXSIZE)
+
+
+def _enqueue_write(op: str, path: str, value: object = None):
+    """Queue a 'push', 'set' or 'increment' write for the background flusher."""
+    _start_writer()
+    try:
+        _write_queue.put_nowait((op, path, value))
+    except queue.Full:
+        print(f"❌ Analytics write queue full, dropping {op} to {path}")
+
+
+def _flush_writes(batch: List[Tuple[str, str, object]]) -> bool:
+    """Commit a batch of queued writes, retrying in place; True once committed."""
+    updates = {}
+    increments = Counter()
+    
+    for op, path, value in batch:
+        if op == "push":
+            updates[f"{path}/{generate_push_key()}"] = value
+        elif op == "set":
+            updates[path] = value
+        elif op == "increment":
+            increments[path] += value
+    
+    for path, amount in increments.items():
+        updates[path] = server_increment(amount)
+    
+    if not updates:
+        return True
+    
+    for attempt in range(1, _WRITE_FLUSH_ATTEMPTS + 1):
+        try:
+            db.reference('/').update(updates)
+            return True
+        except Exception as e:
+            print(f"❌ Error flushing {len(batch)} analytics writes (attempt {attempt}/{_WRITE_FLUSH_ATTEMPTS}): {e}")
+            if attempt < _WRITE_FLUSH_ATTEMPTS:
+                time.sleep(_WRITE_RETRY_BACKOFF_SECONDS * attempt)
+    return False
+
+
+def _requeue_writes(batch: List[Tuple[str, str, object]]):
+    """Put a failed batch back on the queue after a pause (the writer thread is the only consumer)."""
+    time.sleep(_WRITE_REQUEUE_DELAY_SECONDS)
+    for index, item in enumerate(batch):
+        try:
+            _write_queue.put_nowait(item)
+        except queue.Full:
+            print(f"❌ Analytics write queue full, dropping {len(batch) - index} re-queued writes")
+            return
+
+
+def _drain_writes():
+    """Background loop: block for one write, then sweep up to a full batch."""
+    while True:
+        item = _write_queue.get()
+        if item is None:
+            return
+        
+        batch = [item]
+        stop = False
+        while len(batch) < _WRITE_BATCH_SIZE:
+            try:
+                item = _write_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        
+        if not _flush_writes(batch) and not stop:
+            _requeue_writes(batch)
+        if stop:
+            return
+
+
+# Started by the first queued write, so importing this module (e.g. for
+# the counter helpers) spawns no thread and registers no exit hook.
+_writer_thread = None
+_writer_lock = threading.Lock()
+
+
+def _start_writer():
+    """Start the writer thread and its exit flush once per process."""
+    global _writer_thread
+    if _writer_thread is not None:
+        return
+    with _writer_lock:
+        if _writer_thread is None:
+            thread = threading.Thread(target=_drain_writes, name="analytics-writer", daemon=True)
+            thread.start()
+            atexit.register(_flush_on_exit)
+            _writer_thread = thread
+
+
+def _flush_on_exit():
+    """Let the writer commit whatever is still queued before the process exits."""
+    _write_queue.put(None)
+    _writer_thread.join(timeout=10)
 
 
 # ============================================================
@@ -23,6 +181,8 @@ def track_engagement(
     """
     Track user engagement activity.
     
+    The write is queued and committed in the background.
+    
     Args:
         community: Community name
         username: User performing the activity
@@ -40,11 +200,7 @@ def track_engagement(
         "timestamp": datetime.now().isoformat()
     }
     
-    try:
-        ref = db.reference(f'analytics/engagement/{community}')
-        ref.push(engagement)
-    except Exception as e:
-        print(f"❌ Error tracking engagement: {e}")
+    _enqueue_write("push", f'analytics/engagement/{community}', engagement)
 
 
 def track_content_view(
@@ -53,7 +209,7 @@ def track_content_view(
     content_type: str,
     viewer_username: str
 ):
-    """Track when content is viewed."""
+    """Track when content is viewed (queued, committed in the background)."""
     view = {
         "content_id": content_id,
         "content_type": content_type,
@@ -61,17 +217,310 @@ def track_content_view(
         "timestamp": datetime.now().isoformat()
     }
     
-    try:
-        ref = db.reference(f'analytics/content_views/{community}/{content_id}')
-        ref.push(view)
-    except Exception as e:
-        print(f"❌ Error tracking view: {e}")
+    _enqueue_write("push", f'analytics/content_views/{community}/{content_id}', view)
+    
+    # Reach counters: idempotent viewer map + atomic view total
+    if viewer_username:
+        _enqueue_write(
+            "set",
+            f'analytics/content_viewers/{community}/{content_id}/{viewer_username}',
+            view["timestamp"]
+        )
+    _enqueue_write("increment", f'analytics/content_view_counts/{community}/{content_id}', 1)
+
+
+# ============================================================
+# Write-time Counters
+# ============================================================
+
+def server_increment(amount: int = 1) -> Dict:
+    """Server value that atomically adds `amount` when written in an update()."""
+    return {".sv": {"increment": amount}}
+
+
+def message_counter_updates(messages: List[Tuple[str, str]]) -> Dict:
+    """
+    Multi-path update entries bumping the message counters read by
+    get_community_stats, for (community, username) pairs.
+    
+    Callers commit the messages and these counters in one write, which
+    rebuild_counters relies on.
+    """
+    counts = Counter()
+    for community, username in messages:
+        counts[f'analytics/counters/{community}/messages'] += 1
+        if username:
+            counts[f'analytics/counters/{community}/users/{username}'] += 1
+    return {path: server_increment(amount) for path, amount in counts.items()}
+
+
+def kb_counter_updates(community: str, added_by: Optional[str] = None) -> Dict:
+    """Multi-path update entries bumping the KB entry counter (and the contributor's, if known)."""
+    updates = {f'analytics/counters/{community}/kb_entries': server_increment(1)}
+    if added_by:
+        updates[f'analytics/counters/{community}/kb_contributions/{added_by}'] = server_increment(1)
+    return updates
+
+
+def opportunity_counter_updates(community: str, posted_by: Optional[str]) -> Dict:
+    """Multi-path update entries bumping the poster's counter read by get_user_engagement_score."""
+    if not posted_by:
+        return {}
+    return {f'analytics/counters/{community}/opportunities_posted/{posted_by}': server_increment(1)}
+
+
+def _scan_counters(community: str) -> Dict:
+    """Count a community's messages, KB entries and opportunities from a full read."""
+    messages = db.reference(f'chats/{community}').get() or {}
+    kb_data = db.reference(f'knowledgebase/{community}/store').get() or {}
+    opp_data = db.reference(f'opportunities/{community}').get() or {}
+    
+    user_counts = Counter(
+        msg.get("username") for msg in messages.values() if msg.get("username")
+    )
+    kb_contributions = Counter(
+        entry.get("metadata", {}).get("added_by") for entry in kb_data.values()
+    )
+    opportunities_posted = Counter(opp.get("posted_by") for opp in opp_data.values())
+    kb_contributions.pop(None, None)
+    opportunities_posted.pop(None, None)
+    
+    return {
+        "messages": len(messages),
+        "users": dict(user_counts),
+        "kb_entries": len(kb_data),
+        "kb_contributions": dict(kb_contributions),
+        "opportunities_posted": dict(opportunities_posted),
+        "built": True
+    }
+
+
+def rebuild_counters(community: str, force: bool = False) -> Dict:
+    """
+    Recompute a community's counters from a full scan and mark them built.
+    
+    Used to backfill communities that have data written before the
+    counters existed (or written directly, e.g. by the seeding scripts).
+    Readers only trust the counters once `built` is set. Without `force`,
+    a community that is already built is left alone.
+    
+    The scan runs inside the transaction. Every writer commits its entry
+    and the matching *_counter_updates() in one multi-path update, so a
+    write landing mid-scan changes the counters node, the transaction
+    retries with a fresh scan, and the stored totals never miss or
+    double-count a concurrent write.
+    
+    Returns:
+        The counters node as stored after the call
+    """
+    def _backfill(current):
+        if current and current.get("built") and not force:
+            return current
+        return _scan_counters(community)
+    
+    return db.reference(f'analytics/counters/{community}').transaction(_backfill)
+
+
+_backfills_started = set()
+_backfills_lock = threading.Lock()
+
+
+def _schedule_backfill(community: str):
+    """Run rebuild_counters for `community` in the background, once per process."""
+    with _backfills_lock:
+        if community in _backfills_started:
+            return
+        _backfills_started.add(community)
+    
+    def _run():
+        try:
+            rebuild_counters(community)
+        except Exception as e:
+            print(f"❌ Error backfilling counters for {community}: {e}")
+            with _backfills_lock:
+                _backfills_started.discard(community)
+    
+    _read_executor.submit(_run)
 
 
 # ============================================================
 # Analytics Queries
 # ============================================================
 
+def _fetch_messages_since(community: str, cutoff_ts: float) -> Dict:
+    """
+    Fetch only the messages posted at or after `cutoff_ts`.
+    
+    The range filter runs server-side through the `timestamp` index
+    declared under `chats/$community` in database.rules.json, so only
+    in-window rows are transferred.
+    """
+    msg_ref = db.reference(f'chats/{community}')
+    return msg_ref.order_by_child('timestamp').start_at(cutoff_ts).get() or {}
+
+
+def _daily_message_counts(community: str, day: date) -> Tuple[int, frozenset]:
+    """
+    Message count and active usernames for a single local calendar day.
+    
+    Past days are cached for HISTORICAL_TTL_SECONDS, today's bucket for
+    CURRENT_TTL_SECONDS.
+    """
+    def load() -> Tuple[int, frozenset]:
+        day_start = datetime.combine(day, datetime.min.time())
+        start_ts = day_start.timestamp()
+        end_ts = (day_start + timedelta(days=1)).timestamp()
+        
+        msg_ref = db.reference(f'chats/{community}')
+        messages = msg_ref.order_by_child('timestamp').start_at(start_ts).end_at(end_ts).get() or {}
+        
+        count = 0
+        users = set()
+        for msg in messages.values():
+            timestamp = msg.get("timestamp", 0)
+            if isinstance(timestamp, (int, float)) and timestamp < end_ts:
+                count += 1
+                username = msg.get("username", "")
+                if username:
+                    users.add(username)
+        return count, frozenset(users)
+    
+    ttl = CURRENT_TTL_SECONDS if day >= date.today() else HISTORICAL_TTL_SECONDS
+    return _cached(("daily_messages", community, day), ttl, load)
+
+
+MessageAggregates = namedtuple(
+    "MessageAggregates",
+    "total_messages total_users active_users message_counts question_counts last_active"
+)
+
+_NON_CONTRIBUTORS = frozenset({"KB-Bot", "KB-Summary", "system"})
+
+# Below this many messages the plain dict loop beats NumPy's setup cost.
+_VECTORIZE_THRESHOLD = 1000
+
+
+# A "?" anywhere, or a leading wh-/how word (case-insensitive), in one pass
+_QUESTION_RE = re.compile(r'\?|^(?:what|how|why|when|where|who)', re.IGNORECASE)
+
+
+def _is_question(content: str) -> bool:
+    """Heuristic question detector over raw message content."""
+    return _QUESTION_RE.search(content) is not None
+
+
+def _scan_messages(messages: Dict, cutoff_ts: float) -> MessageAggregates:
+    """
+    Compute every message-derived aggregate in a single pass.
+    
+    Args:
+        messages: Raw `chats/{community}` snapshot (full or windowed)
+        cutoff_ts: Messages at or after this timestamp count as in-period
+    
+    Returns:
+        MessageAggregates with all-time totals over `messages`, in-period
+        active users, and per-user message/question counts and last-active
+        timestamps for in-period contributors
+    """
+    if len(messages) >= _VECTORIZE_THRESHOLD:
+        return _scan_messages_vectorized(messages, cutoff_ts)
+    
+    users = set()
+    recent_users = set()
+    message_counts = Counter()
+    question_counts = defaultdict(int)
+    last_active = {}
+    
+    for msg in messages.values():
+        username = msg.get("username", "")
+        if not username:
+            continue
+        users.add(username)
+        
+        timestamp = msg.get("timestamp", 0)
+        if not isinstance(timestamp, (int, float)) or timestamp < cutoff_ts:
+            continue
+        recent_users.add(username)
+        
+        if username in _NON_CONTRIBUTORS:
+            continue
+        
+        message_counts[username] += 1
+        
+        # Check if it's a question
+        if _is_question(msg.get("content", "")):
+            question_counts[username] += 1
+        
+        # Update last active
+        if timestamp > last_active.get(username, 0.0):
+            last_active[username] = timestamp
+    
+    return MessageAggregates(
+        total_messages=len(messages),
+        total_users=len(users),
+        active_users=len(recent_users),
+        message_counts=message_counts,
+        question_counts=question_counts,
+        last_active=last_active
+    )
+
+
+def _scan_messages_vectorized(messages: Dict, cutoff_ts: float) -> MessageAggregates:
+    """NumPy group-by equivalent of _scan_messages for large snapshots."""
+    rows = [msg for msg in messages.values() if msg.get("username", "")]
+    if not rows:
+        return MessageAggregates(len(messages), 0, 0, Counter(), defaultdict(int), {})
+    
+    usernames = np.array([msg["username"] for msg in rows])
+    timestamps = np.fromiter(
+        (
+            ts if isinstance(ts := msg.get("timestamp", 0), (int, float)) else np.nan
+            for msg in rows
+        ),
+        dtype=np.float64,
+        count=len(rows)
+    )
+    
+    # NaN (non-numeric timestamps) never compares >= cutoff
+    in_period = timestamps >= cutoff_ts
+    contributing = in_period & ~np.isin(usernames, list(_NON_CONTRIBUTORS))
+    
+    contrib_idx = np.flatnonzero(contributing)
+    contrib_users = usernames[contrib_idx]
+    contrib_ts = timestamps[contrib_idx]
+    is_question = np.fromiter(
+        (_is_question(rows[i].get("content", "")) for i in contrib_idx),
+        dtype=bool,
+        count=len(contrib_idx)
+    )
+    
+    names, first_seen, inverse, message_counts = np.unique(
+        contrib_users, return_index=True, return_inverse=True, return_counts=True
+    )
+    question_counts = np.bincount(inverse, weights=is_question, minlength=len(names))
+    last_active = np.full(len(names), -np.inf)
+    np.maximum.at(last_active, inverse, contrib_ts)
+    
+    # Emit users in first-seen order so ranking ties match the dict path
+    message_counter = Counter()
+    question_counter = defaultdict(int)
+    last_active_by_user = {}
+    for i in np.argsort(first_seen, kind="stable"):
+        username = str(names[i])
+        message_counter[username] = int(message_counts[i])
+        question_counter[username] = int(question_counts[i])
+        last_active_by_user[username] = float(last_active[i])
+    
+    return MessageAggregates(
+        total_messages=len(messages),
+        total_users=len(np.unique(usernames)),
+        active_users=len(np.unique(usernames[in_period])),
+        message_counts=message_counter,
+        question_counts=question_counter,
+        last_active=last_active_by_user
+    )
+
+
 def get_community_stats(community: str, days: int = 30) -> Dict:
     """
     Get overall community statistics.
@@ -83,7 +532,53 @@ def get_community_stats(community: str, days: int = 30) -> Dict:
     Returns:
         Dictionary with various stats
     """
-    cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
+    return dict(_cached(
+        ("community_stats", community, days),
+        CURRENT_TTL_SECONDS,
+        lambda: _compute_community_stats(community, days)
+    ))
+
+
+def _compute_community_stats(community: str, days: int) -> Dict:
+    """Uncached body of get_community_stats."""
+    cutoff_ts = (datetime.now() - timedelta(days=days)).timestamp()
+    stats, _ = _gather_community_stats(community, days, cutoff_ts)
+    return stats
+
+
+def _read(path: str, shallow: bool = False):
+    """Blocking RTDB read, suitable for submitting to _read_executor."""
+    return db.reference(path).get(shallow=shallow)
+
+
+def _count_equal(path: str, child: str, value: str) -> int:
+    """Count children of `path` whose `child` equals `value` via an indexed query."""
+    return len(db.reference(path).order_by_child(child).equal_to(value).get() or {})
+
+
+def _gather_community_stats(
+    community: str,
+    days: int,
+    cutoff_ts: float
+) -> Tuple[Dict, Optional[MessageAggregates]]:
+    """
+    Read counters, in-period chats and opportunities concurrently and
+    build the stats dict.
+    
+    All-time totals come from the write-time counters under
+    analytics/counters/{community} once they are marked built; until then
+    this falls back to a full chat/KB scan and schedules the backfill.
+    
+    Returns:
+        (stats, aggregates) - aggregates is None if the chat read failed
+    """
+    counters_path = f'analytics/counters/{community}'
+    built_future = _read_executor.submit(_read, f'{counters_path}/built')
+    messages_future = _read_executor.submit(_read, f'{counters_path}/messages')
+    users_future = _read_executor.submit(_read, f'{counters_path}/users', True)
+    kb_future = _read_executor.submit(_read, f'{counters_path}/kb_entries')
+    recent_future = _read_executor.submit(_fetch_messages_since, community, cutoff_ts)
+    opp_future = _read_executor.submit(_read, f'opportunities/{community}', True)
     
     stats = {
         "total_messages": 0,
@@ -94,53 +589,36 @@ def get_community_stats(community: str, days: int = 30) -> Dict:
         "avg_messages_per_user": 0,
         "period_days": days
     }
+    aggregates = None
     
     try:
-        # Get messages
-        msg_ref = db.reference(f'chats/{community}')
-        messages = msg_ref.get()
+        if not built_future.result():
+            # Counters not backfilled yet - all-time totals need the full history
+            _schedule_backfill(community)
+            aggregates = _scan_messages(_read(f'chats/{community}') or {}, cutoff_ts)
+            stats["total_messages"] = aggregates.total_messages
+            stats["total_users"] = aggregates.total_users
+            stats["total_kb_entries"] = len(_read(f'knowledgebase/{community}/store', True) or {})
+        else:
+            aggregates = _scan_messages(recent_future.result(), cutoff_ts)
+            stats["total_messages"] = messages_future.result() or 0
+            stats["total_users"] = len(users_future.result() or {})
+            stats["total_kb_entries"] = kb_future.result() or 0
         
-        if messages:
-            stats["total_messages"] = len(messages)
-            
-            # Count unique users
-            users = set()
-            recent_users = set()
-            
-            for msg in messages.values():
-                username = msg.get("username", "")
-                if username:
-                    users.add(username)
-                    
-                    # Check if message is recent
-                    timestamp = msg.get("timestamp", 0)
-                    if isinstance(timestamp, (int, float)):
-                        msg_date = datetime.fromtimestamp(timestamp).isoformat()
-                        if msg_date >= cutoff_date:
-                            recent_users.add(username)
-            
-            stats["total_users"] = len(users)
-            stats["active_users"] = len(recent_users)
-            
-            if stats["total_users"] > 0:
-                stats["avg_messages_per_user"] = round(stats["total_messages"] / stats["total_users"], 2)
+        stats["active_users"] = aggregates.active_users
         
-        # Get KB size
-        kb_ref = db.reference(f'knowledgebase/{community}/store')
-        kb_data = kb_ref.get()
-        if kb_data:
-            stats["total_kb_entries"] = len(kb_data)
+        if stats["total_users"] > 0:
+            stats["avg_messages_per_user"] = round(stats["total_messages"] / stats["total_users"], 2)
         
         # Get opportunities
-        opp_ref = db.reference(f'opportunities/{community}')
-        opp_data = opp_ref.get()
+        opp_data = opp_future.result()
         if opp_data:
             stats["total_opportunities"] = len(opp_data)
         
     except Exception as e:
         print(f"❌ Error getting community stats: {e}")
     
-    return stats
+    return stats, aggregates
 
 
 def get_top_contributors(community: str, days: int = 30, limit: int = 10) -> List[Dict]:
@@ -155,60 +633,30 @@ def get_top_contributors(community: str, days: int = 30, limit: int = 10) -> Lis
     Returns:
         List of contributors with stats
     """
-    cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
+    cutoff_ts = (datetime.now() - timedelta(days=days)).timestamp()
     
     try:
-        msg_ref = db.reference(f'chats/{community}')
-        messages = msg_ref.get()
-        
-        if not messages:
-            return []
-        
-        # Count messages per user
-        user_stats = defaultdict(lambda: {
-            "username": "",
-            "message_count": 0,
-            "question_count": 0,
-            "last_active": ""
-        })
-        
-        for msg in messages.values():
-            username = msg.get("username", "")
-            if not username or username in ["KB-Bot", "KB-Summary", "system"]:
-                continue
-            
-            timestamp = msg.get("timestamp", 0)
-            if isinstance(timestamp, (int, float)):
-                msg_date = datetime.fromtimestamp(timestamp).isoformat()
-                
-                # Only count recent messages
-                if msg_date >= cutoff_date:
-                    user_stats[username]["username"] = username
-                    user_stats[username]["message_count"] += 1
-                    
-                    # Check if it's a question
-                    content = msg.get("content", "").lower()
-                    if "?" in content or content.startswith(("what", "how", "why", "when", "where", "who")):
-                        user_stats[username]["question_count"] += 1
-                    
-                    # Update last active
-                    if msg_date > user_stats[username]["last_active"]:
-                        user_stats[username]["last_active"] = msg_date
-        
-        # Sort by message count
-        contributors = sorted(
-            user_stats.values(),
-            key=lambda x: x["message_count"],
-            reverse=True
-        )
-        
-        return contributors[:limit]
+        messages = _fetch_messages_since(community, cutoff_ts)
+        return _build_top_contributors(_scan_messages(messages, cutoff_ts), limit)
         
     except Exception as e:
         print(f"❌ Error getting top contributors: {e}")
         return []
 
 
+def _build_top_contributors(aggregates: MessageAggregates, limit: int) -> List[Dict]:
+    """Top `limit` contributors by message count (heap-based, O(n log limit))."""
+    return [
+        {
+            "username": username,
+            "message_count": count,
+            "question_count": aggregates.question_counts[username],
+            "last_active": datetime.fromtimestamp(aggregates.last_active[username]).isoformat()
+        }
+        for username, count in aggregates.message_counts.most_common(limit)
+    ]
+
+
 def get_engagement_trends(community: str, days: int = 30) -> Dict:
     """
     Get engagement trends over time.
@@ -220,50 +668,30 @@ def get_engagement_trends(community: str, days: int = 30) -> Dict:
     Returns:
         Dictionary with daily engagement data
     """
-    cutoff_date = datetime.now() - timedelta(days=days)
+    today = date.today()
     
     trends = {
-        "daily_messages": defaultdict(int),
-        "daily_active_users": defaultdict(set),
-        "activity_types": Counter()
+        "daily_messages": {},
+        "daily_active_users": {},
+        "activity_types": {}
     }
     
     try:
-        # Analyze messages
-        msg_ref = db.reference(f'chats/{community}')
-        messages = msg_ref.get()
-        
-        if messages:
-            for msg in messages.values():
-                timestamp = msg.get("timestamp", 0)
-                if isinstance(timestamp, (int, float)):
-                    msg_datetime = datetime.fromtimestamp(timestamp)
-                    
-                    if msg_datetime >= cutoff_date:
-                        date_key = msg_datetime.strftime("%Y-%m-%d")
-                        trends["daily_messages"][date_key] += 1
-                        
-                        username = msg.get("username", "")
-                        if username:
-                            trends["daily_active_users"][date_key].add(username)
+        # Analyze messages one cached day bucket at a time (cold days fetched concurrently)
+        window = [today - timedelta(days=offset) for offset in range(days, -1, -1)]
+        buckets = _read_executor.map(lambda day: _daily_message_counts(community, day), window)
+        for day, (count, users) in zip(window, buckets):
+            if count:
+                date_key = day.isoformat()
+                trends["daily_messages"][date_key] = count
+                trends["daily_active_users"][date_key] = len(users)
         
         # Analyze engagement activities
-        eng_ref = db.reference(f'analytics/engagement/{community}')
-        engagements = eng_ref.get()
-        
-        if engagements:
-            for eng in engagements.values():
-                activity_type = eng.get("type", "unknown")
-                trends["activity_types"][activity_type] += 1
-        
-        # Convert sets to counts
-        trends["daily_active_users"] = {
-            date: len(users) for date, users in trends["daily_active_users"].items()
-        }
-        
-        # Convert to regular dicts for JSON serialization
-        trends["daily_messages"] = dict(trends["daily_messages"])
-        trends["activity_types"] = dict(trends["activity_types"])
+        trends["activity_types"] = dict(_cached(
+            ("activity_types", community),
+            CURRENT_TTL_SECONDS,
+            lambda: _count_activity_types(community)
+        ))
         
     except Exception as e:
         print(f"❌ Error getting engagement trends: {e}")
@@ -271,6 +699,18 @@ def get_engagement_trends(community: str, days: int = 30) -> Dict:
     return trends
 
 
+def _count_activity_types(community: str) -> Counter:
+    """Count tracked engagement events by activity type."""
+    eng_ref = db.reference(f'analytics/engagement/{community}')
+    engagements = eng_ref.get()
+    
+    activity_types = Counter()
+    if engagements:
+        for eng in engagements.values():
+            activity_types[eng.get("type", "unknown")] += 1
+    return activity_types
+
+
 def get_content_reach(community: str, content_id: str) -> Dict:
     """
     Get reach metrics for specific content.
@@ -289,6 +729,21 @@ def get_content_reach(community: str, content_id: str) -> Dict:
     }
     
     try:
+        viewers_future = _read_executor.submit(
+            lambda: db.reference(
+                f'analytics/content_viewers/{community}/{content_id}'
+            ).get(shallow=True)
+        )
+        total_views = _read(f'analytics/content_view_counts/{community}/{content_id}')
+        viewers = viewers_future.result()
+        
+        if viewers or total_views:
+            reach["total_views"] = total_views or 0
+            reach["unique_viewers"] = len(viewers or {})
+            reach["viewers"] = list((viewers or {}).keys())
+            return reach
+        
+        # Content tracked before the reach counters existed
         ref = db.reference(f'analytics/content_views/{community}/{content_id}')
         views = ref.get()
         
@@ -322,7 +777,7 @@ def get_user_engagement_score(username: str, community: str, days: int = 30) ->
     Returns:
         Dictionary with engagement metrics and score
     """
-    cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
+    cutoff_ts = (datetime.now() - timedelta(days=days)).timestamp()
     
     metrics = {
         "username": username,
@@ -334,41 +789,36 @@ def get_user_engagement_score(username: str, community: str, days: int = 30) ->
     }
     
     try:
-        # Count messages
-        msg_ref = db.reference(f'chats/{community}')
-        messages = msg_ref.get()
-        
-        if messages:
-            for msg in messages.values():
-                if msg.get("username") == username:
-                    timestamp = msg.get("timestamp", 0)
-                    if isinstance(timestamp, (int, float)):
-                        msg_date = datetime.fromtimestamp(timestamp).isoformat()
-                        
-                        if msg_date >= cutoff_date:
-                            metrics["messages_sent"] += 1
-                            
-                            content = msg.get("content", "").lower()
-                            if "?" in content:
-                                metrics["questions_asked"] += 1
-        
-        # Count KB contributions
-        kb_ref = db.reference(f'knowledgebase/{community}/store')
-        kb_data = kb_ref.get()
+        # Count messages (server-side time window, user filter client-side)
+        messages = _fetch_messages_since(community, cutoff_ts)
         
-        if kb_data:
-            for entry in kb_data.values():
-                if entry.get("metadata", {}).get("added_by") == username:
-                    metrics["kb_contributions"] += 1
+        for msg in messages.values():
+            if msg.get("username") == username:
+                timestamp = msg.get("timestamp", 0)
+                if isinstance(timestamp, (int, float)):
+                    metrics["messages_sent"] += 1
+                    
+                    if _is_question(msg.get("content", "")):
+                        metrics["questions_asked"] += 1
         
-        # Count opportunities posted
-        opp_ref = db.reference(f'opportunities/{community}')
-        opp_data = opp_ref.get()
+        # Count KB contributions / opportunities posted from per-user counters
+        counters_path = f'analytics/counters/{community}'
+        built_future = _read_executor.submit(_read, f'{counters_path}/built')
+        kb_future = _read_executor.submit(_read, f'{counters_path}/kb_contributions/{username}')
+        opp_future = _read_executor.submit(_read, f'{counters_path}/opportunities_posted/{username}')
         
-        if opp_data:
-            for opp in opp_data.values():
-                if opp.get("posted_by") == username:
-                    metrics["opportunities_posted"] += 1
+        if built_future.result():
+            metrics["kb_contributions"] = kb_future.result() or 0
+            metrics["opportunities_posted"] = opp_future.result() or 0
+        else:
+            # Counters not backfilled yet - let the indexes return only this user's keys
+            _schedule_backfill(community)
+            metrics["kb_contributions"] = _count_equal(
+                f'knowledgebase/{community}/store', 'metadata/added_by', username
+            )
+            metrics["opportunities_posted"] = _count_equal(
+                f'opportunities/{community}', 'posted_by', username
+            )
         
         # Calculate engagement score (weighted)
         score = (
@@ -397,11 +847,26 @@ def generate_analytics_report(community: str, days: int = 30) -> str:
     Returns:
         Formatted report string
     """
-    stats = get_community_stats(community, days)
-    contributors = get_top_contributors(community, days, limit=5)
-    trends = get_engagement_trends(community, days)
+    cutoff_ts = (datetime.now() - timedelta(days=days)).timestamp()
+    
+    activity_future = _read_executor.submit(
+        _cached,
+        ("activity_types", community),
+        CURRENT_TTL_SECONDS,
+        lambda: _count_activity_types(community)
+    )
     
-    report = f"""
+    # One fetch + one scan feeds both the overview and the contributors list
+    stats, aggregates = _gather_community_stats(community, days, cutoff_ts)
+    contributors = _build_top_contributors(aggregates, limit=5) if aggregates else []
+    
+    try:
+        activity_types = activity_future.result()
+    except Exception as e:
+        print(f"❌ Error getting engagement trends: {e}")
+        activity_types = {}
+    
+    header = f"""
 # Analytics Report: {community}
 **Period:** Last {days} days
 **Generated:** {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
@@ -421,15 +886,22 @@ def generate_analytics_report(community: str, days: int = 30) -> str:
 ## Top Contributors
 """
     
-    for i, contributor in enumerate(contributors, 1):
-        report += f"\n{i}. **{contributor['username']}**\n"
-        report += f"   - Messages: {contributor['message_count']}\n"
-        report += f"   - Questions: {contributor['question_count']}\n"
-        report += f"   - Last Active: {contributor['last_active'][:10]}\n"
-    
-    report += "\n---\n\n## Activity Breakdown\n"
-    
-    for activity_type, count in trends['activity_types'].items():
-        report += f"- **{activity_type.title()}:** {count}\n"
-    
-    return report
+    contributor_lines = [
+        f"\n{i}. **{contributor['username']}**\n"
+        f"   - Messages: {contributor['message_count']}\n"
+        f"   - Questions: {contributor['question_count']}\n"
+        f"   - Last Active: {contributor['last_active'][:10]}\n"
+        for i, contributor in enumerate(contributors, 1)
+    ]
+    
+    activity_lines = [
+        f"- **{activity_type.title()}:** {count}\n"
+        for activity_type, count in activity_types.items()
+    ]
+    
+    return "".join([
+        header,
+        *contributor_lines,
+        "\n---\n\n## Activity Breakdown\n",
+        *activity_lines
+    ])
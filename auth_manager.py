@@ -6,8 +6,13 @@ Handles JWT tokens, session management, password hashing, and role-based access
 import os
 import jwt
 import bcrypt
+import base64
+import hashlib
 import secrets
-from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, List
 from functools import wraps
 from fastapi import HTTPException, Request, Depends
@@ -15,14 +20,98 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import firebase_admin
 from firebase_admin import db as firebase_db
 
+from ttl_cache import TTLCache
+
 # JWT Configuration
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", secrets.token_urlsafe(32))
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 REFRESH_TOKEN_EXPIRE_DAYS = 30
 
+# bcrypt cost factor, pinned so a library upgrade can't silently change it
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Sessions: numeric expiry so the sweeper can range-scan the expires_at index
+SESSION_TTL_SECONDS = 24 * 60 * 60
+SESSION_SWEEP_INTERVAL_SECONDS = 60 * 60
+
 security = HTTPBearer()
 
+# Password verification cache: skips bcrypt for a (password, hash) pair
+# verified moments ago. Failures are only remembered very briefly.
+VERIFY_CACHE_TTL_SECONDS = 60
+VERIFY_CACHE_NEGATIVE_TTL_SECONDS = 2
+VERIFY_CACHE_MAXSIZE = 10000
+
+# Per-process key so cached digests are useless outside this process
+_verify_cache_key = secrets.token_bytes(32)
+_verify_cache = TTLCache(VERIFY_CACHE_MAXSIZE)  # {(digest, hash): ok}
+
+# Decoded-token cache: a verified token's payload is reused until shortly
+# before its own `exp`. Invalid tokens are never cached.
+TOKEN_CACHE_MAXSIZE = 50000
+TOKEN_CACHE_EXPIRY_MARGIN_SECONDS = 5
+_token_cache = TTLCache(TOKEN_CACHE_MAXSIZE, clock=time.time)  # {token: payload}
+
+# Per-user auth state consulted on every authenticated request
+USER_CACHE_TTL_SECONDS = 30
+USER_CACHE_MAXSIZE = 20000
+_user_status_cache = TTLCache(USER_CACHE_MAXSIZE)  # {username: is_active}
+_user_roles_cache = TTLCache(USER_CACHE_MAXSIZE)  # {username: roles}
+
+
+def email_index_key(email: str) -> str:
+    """Key for users_by_email/{key} (RTDB keys can't contain '.')."""
+    return base64.urlsafe_b64encode(email.strip().lower().encode('utf-8')).decode('ascii')
+
+
+# users_by_email is only trusted once migrations/users_by_email is set
+_EMAIL_INDEX_MARKER = 'migrations/users_by_email'
+_email_index_ready = False
+_email_index_lock = threading.Lock()
+
+
+def _ensure_email_index():
+    """
+    Backfill users_by_email from the users node (one full read), once,
+    then set the migration marker.
+    
+    Registration writes single entries, so the index existing never means
+    it covers accounts created before it. The backfill merges into the
+    index rather than replacing it, so concurrent registrations survive.
+    """
+    global _email_index_ready
+    if _email_index_ready:
+        return
+    with _email_index_lock:
+        if _email_index_ready:
+            return
+        if not firebase_db.reference(_EMAIL_INDEX_MARKER).get():
+            users = firebase_db.reference('users').get() or {}
+            updates = {
+                f'users_by_email/{email_index_key(user_data["email"])}': username
+                for username, user_data in users.items()
+                if isinstance(user_data, dict) and user_data.get('email')
+            }
+            updates[_EMAIL_INDEX_MARKER] = True
+            firebase_db.reference().update(updates)
+        _email_index_ready = True
+
+
+def email_registered(email: str) -> bool:
+    """
+    True if any account already uses `email` (one read of the
+    users_by_email index, backfilled once by _ensure_email_index).
+    """
+    _ensure_email_index()
+    return bool(firebase_db.reference(f'users_by_email/{email_index_key(email)}').get())
+
+
+def invalidate_user_cache(username: str):
+    """Drop cached auth state for a user (login, logout, role change)."""
+    _user_status_cache.pop(username, None)
+    _user_roles_cache.pop(username, None)
+
 
 class AuthManager:
     """Manages authentication and authorization"""
@@ -36,17 +125,30 @@ class AuthManager:
     @staticmethod
     def hash_password(password: str) -> str:
         """Hash a password using bcrypt"""
-        salt = bcrypt.gensalt()
+        salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
         hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
         return hashed.decode('utf-8')
     
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
-        """Verify a password against its hash"""
-        return bcrypt.checkpw(
+        """Verify a password against its hash (recent results are cached)"""
+        digest = hashlib.blake2b(
+            plain_password.encode('utf-8'), key=_verify_cache_key, digest_size=16
+        ).digest()
+        cache_key = (digest, hashed_password)
+        
+        cached = _verify_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        ok = bcrypt.checkpw(
             plain_password.encode('utf-8'),
             hashed_password.encode('utf-8')
         )
+        
+        ttl = VERIFY_CACHE_TTL_SECONDS if ok else VERIFY_CACHE_NEGATIVE_TTL_SECONDS
+        _verify_cache.set(cache_key, ok, ttl)
+        return ok
     
     # ==================== Token Management ====================
     
@@ -83,14 +185,24 @@ class AuthManager:
         return encoded_jwt
     
     def decode_token(self, token: str) -> Dict:
-        """Decode and verify a JWT token"""
+        """Decode and verify a JWT token (verified payloads are cached until expiry)"""
+        cached = _token_cache.get(token)
+        if cached is not None:
+            return dict(cached)
+        
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
-            return payload
         except jwt.ExpiredSignatureError:
+            _token_cache.pop(token, None)
             raise HTTPException(status_code=401, detail="Token has expired")
-        except jwt.JWTError:
+        except jwt.InvalidTokenError:
             raise HTTPException(status_code=401, detail="Invalid token")
+        
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            _token_cache.set(token, dict(payload), expires_at=exp - TOKEN_CACHE_EXPIRY_MARGIN_SECONDS)
+        
+        return payload
     
     # ==================== User Management ====================
     
@@ -98,17 +210,14 @@ class AuthManager:
                      full_name: str = "") -> Dict:
         """Register a new user"""
         try:
-            ref = firebase_db.reference('users')
-            
-            # Check if user exists
-            users = ref.get() or {}
-            if username in users:
+            # Check if user exists (keys only, not the profile payload)
+            if firebase_db.reference(f'users/{username}').get(shallow=True):
                 raise HTTPException(status_code=400, detail="Username already exists")
             
-            # Check email uniqueness
-            for user_data in users.values():
-                if user_data.get('email') == email:
-                    raise HTTPException(status_code=400, detail="Email already registered")
+            # Check email uniqueness (users_by_email index)
+            if email_registered(email):
+                raise HTTPException(status_code=400, detail="Email already registered")
+            email_key = email_index_key(email)
             
             # Create user
             user_data = {
@@ -124,7 +233,11 @@ class AuthManager:
                 "last_login": None
             }
             
-            ref.child(username).set(user_data)
+            # Profile and email index land together in one multi-path write
+            firebase_db.reference().update({
+                f'users/{username}': user_data,
+                f'users_by_email/{email_key}': username
+            })
             
             return {
                 "username": username,
@@ -156,6 +269,7 @@ class AuthManager:
             
             # Update last login
             ref.update({"last_login": datetime.utcnow().isoformat()})
+            invalidate_user_cache(username)
             
             # Remove password hash from returned data
             user_data.pop('password_hash', None)
@@ -179,6 +293,27 @@ class AuthManager:
         except Exception:
             return None
     
+    def get_user_status(self, username: str) -> Optional[bool]:
+        """
+        Get a user's `is_active` flag (None if the user doesn't exist).
+        
+        Reads the single field rather than the whole profile and caches it
+        for USER_CACHE_TTL_SECONDS.
+        """
+        cached = _user_status_cache.get(username)
+        if cached is not None:
+            return cached
+        
+        try:
+            is_active = firebase_db.reference(f'users/{username}/is_active').get()
+        except Exception:
+            return None
+        
+        if is_active is not None:
+            is_active = bool(is_active)
+            _user_status_cache.set(username, is_active, USER_CACHE_TTL_SECONDS)
+        return is_active
+    
     # ==================== Session Management ====================
     
     def create_session(self, username: str) -> Dict:
@@ -189,7 +324,7 @@ class AuthManager:
             "session_id": session_id,
             "username": username,
             "created_at": datetime.utcnow().isoformat(),
-            "expires_at": (datetime.utcnow() + timedelta(hours=24)).isoformat(),
+            "expires_at": time.time() + SESSION_TTL_SECONDS,
             "is_active": True
         }
         
@@ -199,24 +334,33 @@ class AuthManager:
         return session_data
     
     def validate_session(self, session_id: str) -> Optional[Dict]:
-        """Validate a session"""
+        """
+        Validate a session.
+        
+        Reads only the `is_active` and `expires_at` fields (concurrently).
+        
+        Returns:
+            {"session_id", "is_active", "expires_at"} if valid, else None
+        """
         try:
             ref = firebase_db.reference(f'sessions/{session_id}')
-            session_data = ref.get()
+            active_future = _session_executor.submit(ref.child('is_active').get)
+            expires_at = ref.child('expires_at').get()
+            is_active = active_future.result()
             
-            if not session_data:
+            if not is_active or expires_at is None:
                 return None
             
-            if not session_data.get('is_active'):
-                return None
+            # Sessions created before expiry went numeric store an ISO string
+            if isinstance(expires_at, str):
+                expires_at = datetime.fromisoformat(expires_at).replace(tzinfo=timezone.utc).timestamp()
             
             # Check expiration
-            expires_at = datetime.fromisoformat(session_data['expires_at'])
-            if datetime.utcnow() > expires_at:
+            if time.time() > expires_at:
                 ref.update({"is_active": False})
                 return None
             
-            return session_data
+            return {"session_id": session_id, "is_active": True, "expires_at": expires_at}
         except Exception:
             return None
     
@@ -225,10 +369,67 @@ class AuthManager:
         try:
             ref = firebase_db.reference(f'sessions/{session_id}')
             ref.update({"is_active": False})
+            
+            username = ref.child('username').get()
+            if username:
+                invalidate_user_cache(username)
         except Exception:
             pass
 
 
+# ==================== Session Expiry Sweep ====================
+
+_session_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="session-read")
+
+
+def purge_expired_sessions() -> int:
+    """
+    Delete every session whose `expires_at` has passed.
+    
+    Uses the `expires_at` index so only expired keys are returned. Sessions
+    created before expiry went numeric store a naive-UTC ISO string; strings
+    sort after every number, so they get their own string range; zero-padded
+    ISO strings compare in time order.
+    
+    Returns:
+        Number of sessions deleted
+    """
+    sessions = firebase_db.reference('sessions')
+    expired = sessions.order_by_child('expires_at').end_at(time.time()).get() or {}
+    legacy_cutoff = datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+    expired.update(
+        sessions.order_by_child('expires_at').start_at("").end_at(legacy_cutoff).get() or {}
+    )
+    if expired:
+        firebase_db.reference('sessions').update({session_id: None for session_id in expired})
+    return len(expired)
+
+
+def _sweep_sessions_forever():
+    """Background loop: purge expired sessions every SESSION_SWEEP_INTERVAL_SECONDS."""
+    while True:
+        time.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+        try:
+            purge_expired_sessions()
+        except Exception as e:
+            print(f"❌ Session sweep failed: {e}")
+
+
+_session_sweeper = None
+_session_sweeper_lock = threading.Lock()
+
+
+def start_session_sweeper():
+    """Start the session sweep thread once per process (called from server startup)."""
+    global _session_sweeper
+    with _session_sweeper_lock:
+        if _session_sweeper is None:
+            _session_sweeper = threading.Thread(
+                target=_sweep_sessions_forever, name="session-sweeper", daemon=True
+            )
+            _session_sweeper.start()
+
+
 # ==================== Dependency Injection ====================
 
 auth_manager = AuthManager()
@@ -243,11 +444,13 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     if username is None:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     
-    user = auth_manager.get_user(username)
-    if user is None:
+    # Only existence and is_active are needed here; full profiles come from
+    # auth_manager.get_user() where an endpoint actually needs them
+    is_active = auth_manager.get_user_status(username)
+    if is_active is None:
         raise HTTPException(status_code=401, detail="User not found")
     
-    return user
+    return {"username": username, "is_active": is_active}
 
 
 async def get_current_active_user(current_user: Dict = Depends(get_current_user)) -> Dict:
@@ -259,6 +462,48 @@ async def get_current_active_user(current_user: Dict = Depends(get_current_user)
 
 # ==================== Role-Based Access Control ====================
 
+# user_roles is only trusted once migrations/user_roles is set
+_USER_ROLES_INDEX_MARKER = 'migrations/user_roles'
+_user_roles_index_ready = False
+_user_roles_index_lock = threading.Lock()
+
+
+def _ensure_user_roles_index():
+    """
+    Backfill user_roles from organization_members for every user, once,
+    then set the migration marker.
+    
+    add_member writes single user_roles entries, so a user's node existing
+    never means it covers memberships that predate the index.
+    """
+    global _user_roles_index_ready
+    if _user_roles_index_ready:
+        return
+    with _user_roles_index_lock:
+        if _user_roles_index_ready:
+            return
+        if not firebase_db.reference(_USER_ROLES_INDEX_MARKER).get():
+            all_memberships = firebase_db.reference('organization_members').get() or {}
+            updates = {
+                f'user_roles/{username}/{org_id}': (member or {}).get('role', 'member')
+                for org_id, members in all_memberships.items()
+                for username, member in members.items()
+            }
+            updates[_USER_ROLES_INDEX_MARKER] = True
+            firebase_db.reference().update(updates)
+        _user_roles_index_ready = True
+
+
+def get_user_roles(username: str) -> Dict[str, str]:
+    """
+    Get a user's roles keyed by org ID from the user_roles/{username} index.
+    
+    Users with no roles get an empty dict (no node, no rescan).
+    """
+    _ensure_user_roles_index()
+    return firebase_db.reference(f'user_roles/{username}').get() or {}
+
+
 class RoleChecker:
     """Check if user has required role"""
     
@@ -270,14 +515,10 @@ class RoleChecker:
         username = current_user.get("username")
         
         try:
-            ref = firebase_db.reference('organization_members')
-            all_memberships = ref.get() or {}
-            
-            user_roles = set()
-            for org_id, members in all_memberships.items():
-                if username in members:
-                    role = members[username].get('role', 'member')
-                    user_roles.add(role)
+            user_roles = _user_roles_cache.get(username)
+            if user_roles is None:
+                user_roles = frozenset(get_user_roles(username).values())
+                _user_roles_cache.set(username, user_roles, USER_CACHE_TTL_SECONDS)
             
             # Check if user has any of the allowed roles
             if not user_roles.intersection(self.allowed_roles):
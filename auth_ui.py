@@ -3,21 +3,59 @@ Authentication UI Components for Streamlit
 Login, Signup, and Session Management
 """
 
-import streamlit as st
-import requests
-from typing import Optional, Dict
+import json
+import threading
 import time
+import streamlit as st
+from typing import Final, Optional, Dict
 
 # Backend URL
 BACKEND_URL = "http://localhost:8001"
 
+# Echo raw login responses to stdout (off by default)
+_DEBUG = False
+
+_JSON_HEADERS: Final[Dict[str, str]] = {"Content-Type": "application/json"}
+
+
+def _encode_json(payload: Dict) -> bytes:
+    """Serialize a request body compactly, straight to bytes"""
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+@st.cache_resource
+def _auth_session() -> "requests.Session":
+    """
+    Shared keep-alive session so auth calls reuse pooled connections
+
+    requests is imported here rather than at module level so already
+    authenticated reruns never pay for its import graph.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 
 # ==================== CSS Styles ====================
 
-def inject_auth_css():
-    """Inject authentication page CSS"""
-    st.markdown("""
+_AUTH_CSS: Final[str] = """
     <style>
+    /* Center the login page (only injected while logged out) */
+    .main .block-container {
+        max-width: 720px;
+        margin: 0 auto;
+    }
+    
     /* Auth Container */
     .auth-container {
         max-width: 450px;
@@ -157,21 +195,42 @@ def inject_auth_css():
         color: #64748b;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+
+@st.cache_data(show_spinner=False)
+def _cached_css() -> str:
+    """Return the auth stylesheet, interned once per process"""
+    return _AUTH_CSS
+
+
+def inject_auth_css():
+    """
+    Inject authentication page CSS
+
+    Must run on every rerun: Streamlit drops elements that a run does not
+    re-emit, so a one-shot injection would unstyle the page after the first
+    interaction. The payload itself comes from the cached constant.
+    """
+    st.markdown(_cached_css(), unsafe_allow_html=True)
 
 
 # ==================== Session Management ====================
 
+_DEFAULTS = (
+    ("authenticated", False),
+    ("user", None),
+    ("access_token", None),
+    ("refresh_token", None),
+)
+
+
 def init_session_state():
     """Initialize session state variables"""
-    if 'authenticated' not in st.session_state:
-        st.session_state.authenticated = False
-    if 'user' not in st.session_state:
-        st.session_state.user = None
-    if 'access_token' not in st.session_state:
-        st.session_state.access_token = None
-    if 'refresh_token' not in st.session_state:
-        st.session_state.refresh_token = None
+    state = st.session_state
+    for key, value in _DEFAULTS:
+        if key not in state:
+            state[key] = value
 
 
 def login_user(username: str, password: str) -> tuple[bool, str, Optional[Dict]]:
@@ -179,39 +238,44 @@ def login_user(username: str, password: str) -> tuple[bool, str, Optional[Dict]]
     Login user and store session
     Returns: (success, message, user_data)
     """
+    import requests
+    
     try:
-        response = requests.post(
+        response = _auth_session().post(
             f"{BACKEND_URL}/api/auth/login",
-            json={"username": username, "password": password},
+            data=_encode_json({"username": username, "password": password}),
+            headers=_JSON_HEADERS,
             timeout=10
         )
         
-        # Debug: print response details
-        print(f"Status Code: {response.status_code}")
-        print(f"Response Text: {response.text[:200]}")
+        if _DEBUG:
+            print(f"Status Code: {response.status_code}")
+            print(f"Response Text: {response.text[:200]}")
         
-        if response.status_code == 200:
-            try:
-                data = response.json()
-            except ValueError as e:
-                return False, f"Server returned invalid JSON: {response.text[:100]}", None
-            
-            if not data.get('ok'):
-                return False, data.get('error', 'Login failed'), None
-            
+        try:
+            data = json.loads(response.content)
+        except ValueError:
+            data = None
+        
+        if response.ok and data and data.get('ok'):
             # Store in session state
             st.session_state.authenticated = True
             st.session_state.user = data.get('user')
             st.session_state.access_token = data.get('access_token')
             st.session_state.refresh_token = data.get('refresh_token')
+            st.session_state["_auth_header"] = (
+                {"Authorization": f"Bearer {data['access_token']}"} if data.get('access_token') else {}
+            )
             
             return True, "Login successful!", data.get('user')
+        
+        if response.ok and data:
+            error_msg = data.get('error', 'Login failed')
+        elif data:
+            error_msg = data.get('detail', f'Server error: {response.status_code}')
         else:
-            try:
-                error_msg = response.json().get('detail', f'Server error: {response.status_code}')
-            except:
-                error_msg = f"Server error {response.status_code}: {response.text[:100]}"
-            return False, error_msg, None
+            error_msg = f"Server error {response.status_code}: {response.text[:100]}"
+        return False, error_msg, None
             
     except requests.exceptions.ConnectionError:
         return False, "Cannot connect to server. Please start backend: python -m uvicorn fastapi_server:app --port 8000", None
@@ -224,23 +288,36 @@ def register_user(username: str, email: str, password: str, full_name: str) -> t
     Register new user
     Returns: (success, message)
     """
+    import requests
+    
     try:
-        response = requests.post(
+        response = _auth_session().post(
             f"{BACKEND_URL}/api/auth/register",
-            json={
+            data=_encode_json({
                 "username": username,
                 "email": email,
                 "password": password,
                 "full_name": full_name
-            },
+            }),
+            headers=_JSON_HEADERS,
             timeout=10
         )
         
-        if response.status_code == 200:
+        try:
+            data = json.loads(response.content)
+        except ValueError:
+            data = None
+        
+        if response.ok and data and data.get('ok'):
             return True, "Registration successful! Please login."
+        
+        if response.ok and data:
+            error_msg = data.get('error', 'Registration failed')
+        elif data:
+            error_msg = data.get('detail', f'Server error: {response.status_code}')
         else:
-            error_msg = response.json().get('detail', 'Registration failed')
-            return False, error_msg
+            error_msg = f"Server error {response.status_code}: {response.text[:100]}"
+        return False, error_msg
             
     except requests.exceptions.ConnectionError:
         return False, "Cannot connect to server. Please ensure the backend is running."
@@ -248,34 +325,77 @@ def register_user(username: str, email: str, password: str, full_name: str) -> t
         return False, f"Registration error: {str(e)}"
 
 
-def logout_user():
-    """Logout user and clear session"""
+def _bg_logout(session: "requests.Session", token: str):
+    """Tell the backend about the logout; the UI never waits on this"""
+    import requests
+    
     try:
-        if st.session_state.access_token:
-            requests.post(
-                f"{BACKEND_URL}/api/auth/logout",
-                headers={"Authorization": f"Bearer {st.session_state.access_token}"},
-                timeout=5
-            )
-    except:
+        session.post(
+            f"{BACKEND_URL}/api/auth/logout",
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=5
+        )
+    except requests.RequestException:
         pass
+
+
+def logout_user():
+    """Logout user and clear session"""
+    token = st.session_state.access_token
+    if token:
+        # Resolve the cached session on the script thread, post off it
+        threading.Thread(target=_bg_logout, args=(_auth_session(), token), daemon=True).start()
     
-    # Clear session state
-    st.session_state.authenticated = False
-    st.session_state.user = None
-    st.session_state.access_token = None
-    st.session_state.refresh_token = None
+    # Clear session state back to the same defaults init_session_state uses
+    state = st.session_state
+    for key, value in _DEFAULTS:
+        state[key] = value
+    state.pop("_auth_header", None)
 
 
 def get_auth_headers() -> Dict[str, str]:
-    """Get authentication headers for API calls"""
-    if st.session_state.access_token:
-        return {"Authorization": f"Bearer {st.session_state.access_token}"}
-    return {}
+    """Get authentication headers for API calls (built once at login)"""
+    return st.session_state.get("_auth_header", {})
 
 
 # ==================== UI Components ====================
 
+# Rerun only the form block on submit where Streamlit supports fragments
+# (1.33+); older releases fall back to a plain full-page rerun.
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def _fetch_avatar(url: str) -> bytes:
+    """Download avatar bytes once per URL instead of on every rerun"""
+    response = _auth_session().get(url, timeout=5)
+    response.raise_for_status()
+    return response.content
+
+
+# Failed avatar URLs are not retried until this many seconds have passed
+AVATAR_RETRY_SECONDS = 300
+_avatar_failures: Dict[str, float] = {}
+
+
+def _load_avatar(url: str) -> Optional[bytes]:
+    """
+    Cached avatar bytes, or None while a recent download of this URL failed
+
+    st.cache_data never stores exceptions, so without this an unreachable
+    avatar host would be re-requested (with retries) on every rerun.
+    """
+    now = time.monotonic()
+    if _avatar_failures.get(url, 0) > now:
+        return None
+    try:
+        return _fetch_avatar(url)
+    except Exception:
+        if len(_avatar_failures) >= 256:
+            _avatar_failures.clear()
+        _avatar_failures[url] = now + AVATAR_RETRY_SECONDS
+        return None
+
+
 def render_login_page():
     """Render login/signup page"""
     inject_auth_css()
@@ -288,33 +408,33 @@ def render_login_page():
     </div>
     """, unsafe_allow_html=True)
     
-    # Center the auth container
-    col1, col2, col3 = st.columns([1, 2, 1])
+    # Tagline only (no duplicate REVOLUTION); centering comes from the
+    # .block-container rule in the auth CSS
+    st.markdown("""
+    <div class="auth-header">
+        <p>Connect, Collaborate, Grow</p>
+    </div>
+    """, unsafe_allow_html=True)
     
-    with col2:
-        # Tagline only (no duplicate REVOLUTION)
-        st.markdown("""
-        <div class="auth-header">
-            <p>Connect, Collaborate, Grow</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Tabs for Login/Signup
-        tab1, tab2 = st.tabs(["Login", "Sign Up"])
-        
-        with tab1:
-            render_login_form()
-        
-        with tab2:
-            render_signup_form()
+    # Tabs for Login/Signup
+    tab1, tab2 = st.tabs(["Login", "Sign Up"])
+    
+    with tab1:
+        render_login_form()
+    
+    with tab2:
+        render_signup_form()
 
 
+@_fragment
 def render_login_form():
     """Render login form"""
     st.markdown("### Welcome Back!")
     st.markdown("Enter your credentials to access your account")
     
     with st.form("login_form"):
+        err_slot = st.empty()
+        
         username = st.text_input(
             "Username",
             placeholder="Enter your username",
@@ -337,18 +457,18 @@ def render_login_form():
         submit = st.form_submit_button("Login", use_container_width=True)
         
         if submit:
-            if not username or not password:
-                st.error("Please enter both username and password")
+            if not (username and password):
+                err_slot.error("Please enter both username and password")
             else:
                 with st.spinner("Logging in..."):
                     success, message, user_data = login_user(username, password)
                     
                     if success:
-                        st.success(message)
-                        time.sleep(1)
+                        err_slot.empty()
+                        st.toast(message, icon="✅")
                         st.rerun()
                     else:
-                        st.error(message)
+                        err_slot.error(message)
     
     # Demo credentials hint
     with st.expander("Demo Credentials"):
@@ -361,11 +481,30 @@ def render_login_form():
         """)
 
 
+def _signup_error(full_name: str, username: str, email: str, password: str,
+                  confirm_password: str, agree_terms: bool) -> Optional[str]:
+    """Client-side signup validation; returns the first error or None"""
+    if not (full_name and username and email and password and confirm_password):
+        return "Please fill in all fields"
+    if password != confirm_password:
+        return "Passwords do not match"
+    if len(password) < 8:
+        return "Password must be at least 8 characters"
+    if not agree_terms:
+        return "Please agree to the Terms & Conditions"
+    return None
+
+
+@_fragment
 def render_signup_form():
     """Render signup form"""
     st.markdown("### Create Account")
     st.markdown("Join our community today!")
     
+    if st.session_state.pop("_signup_done", False):
+        st.balloons()
+        st.info("Please switch to the Login tab to sign in")
+    
     with st.form("signup_form"):
         full_name = st.text_input(
             "Full Name",
@@ -408,33 +547,26 @@ def render_signup_form():
         submit = st.form_submit_button("Create Account", use_container_width=True)
         
         if submit:
-            # Validation
-            if not all([full_name, username, email, password, confirm_password]):
-                st.error("Please fill in all fields")
-            elif password != confirm_password:
-                st.error("Passwords do not match")
-            elif len(password) < 8:
-                st.error("Password must be at least 8 characters")
-            elif not agree_terms:
-                st.error("Please agree to the Terms & Conditions")
+            error = _signup_error(full_name, username, email, password, confirm_password, agree_terms)
+            if error:
+                st.error(error)
             else:
                 with st.spinner("Creating account..."):
                     success, message = register_user(username, email, password, full_name)
                     
                     if success:
-                        st.success(message)
-                        st.balloons()
-                        time.sleep(2)
-                        st.info("Please switch to the Login tab to sign in")
+                        st.toast(message, icon="🎉")
+                        st.session_state["_signup_done"] = True
+                        st.rerun()
                     else:
                         st.error(message)
 
 
 def render_user_profile_badge():
     """Render logged-in user profile badge in sidebar"""
-    if st.session_state.authenticated and st.session_state.user:
-        user = st.session_state.user
-        
+    state = st.session_state
+    user = state.user
+    if state.authenticated and user:
         st.markdown("---")
         
         # User info
@@ -442,7 +574,10 @@ def render_user_profile_badge():
         
         with col1:
             avatar_url = user.get('avatar_url', 'https://ui-avatars.com/api/?name=User')
-            st.image(avatar_url, width=50)
+            try:
+                st.image(_load_avatar(avatar_url) or avatar_url, width=50)
+            except Exception:
+                st.image(avatar_url, width=50)
         
         with col2:
             st.markdown(f"**{user.get('full_name', user.get('username'))}**")
@@ -461,15 +596,15 @@ def require_authentication():
     Decorator/function to require authentication
     Call this at the start of your app
     """
-    init_session_state()
+    if st.session_state.get("authenticated"):
+        # Render user badge in sidebar
+        with st.sidebar:
+            render_user_profile_badge()
+        return
     
-    if not st.session_state.authenticated:
-        render_login_page()
-        st.stop()
-    
-    # Render user badge in sidebar
-    with st.sidebar:
-        render_user_profile_badge()
+    # render_login_page() initializes session state for the logged-out path
+    render_login_page()
+    st.stop()
 
 
 # ==================== Helper Functions ====================
@@ -486,8 +621,9 @@ def is_authenticated() -> bool:
 
 def get_username() -> Optional[str]:
     """Get current username"""
-    user = get_current_user()
-    return user.get('username') if user else None
+    state = st.session_state
+    user = state.user
+    return user.get('username') if (state.authenticated and user) else None
 
 
 # ==================== Testing ====================
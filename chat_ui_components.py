@@ -4,16 +4,18 @@ Bubble-style messages, reactions, threading, typing indicators, and more
 """
 
 import streamlit as st
+import streamlit.components.v1 as components
+import functools
 from datetime import datetime
 from typing import List, Dict, Optional
 import base64
+from html import escape
+from urllib.parse import quote
 
 
 # ==================== CSS Styles ====================
 
-def inject_chat_css():
-    """Inject modern chat CSS styles"""
-    st.markdown("""
+_CHAT_CSS = """
     <style>
     /* Chat Container */
     .chat-container {
@@ -302,28 +304,73 @@ def inject_chat_css():
         transform: scale(1.2);
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+
+def inject_chat_css():
+    """
+    Inject modern chat CSS styles
+
+    Re-emitted on every rerun on purpose: Streamlit removes elements a run
+    does not re-send, so a once-per-session guard would drop the styles.
+    """
+    st.markdown(_CHAT_CSS, unsafe_allow_html=True)
 
 
 # ==================== Message Components ====================
 
-def render_message_bubble(message: Dict, current_user: str):
-    """Render a single message bubble"""
+_fromtimestamp = datetime.fromtimestamp
+
+
+@functools.lru_cache(maxsize=2048)
+def _default_avatar(username: str) -> str:
+    """Generated avatar URL for users without one (URL-encoded, shared per user)"""
+    return "https://ui-avatars.com/api/?name=" + quote(username)
+
+
+@functools.lru_cache(maxsize=4096)
+def _fmt_time(ts_minute: int) -> str:
+    """Format a minute-resolution timestamp as '%I:%M %p', once per minute"""
+    return _fromtimestamp(ts_minute * 60).strftime("%I:%M %p")
+
+
+def message_bubble_html(message: Dict, current_user: str) -> str:
+    """Build the HTML for a single message bubble"""
     username = message.get("username", "Unknown")
-    content = message.get("content", "")
-    timestamp = message.get("timestamp", datetime.now().timestamp())
-    reactions = message.get("reactions", {})
-    thread_count = message.get("thread_count", 0)
-    status = message.get("status", "sent")
-    role = message.get("role", "user")
-    avatar_url = message.get("avatar_url", f"https://ui-avatars.com/api/?name={username}")
-    
-    # Format timestamp
-    dt = datetime.fromtimestamp(timestamp)
-    time_str = dt.strftime("%I:%M %p")
+    timestamp = message.get("timestamp")
+    if timestamp is None:
+        timestamp = datetime.now().timestamp()
+    reactions = message.get("reactions") or {}
+    
+    # Reduce reactions to what the markup shows so unchanged messages
+    # hit the bubble cache
+    reactions_key = tuple(
+        (emoji, len(users), current_user in users) for emoji, users in reactions.items()
+    )
+    
+    return _bubble_html(
+        username,
+        message.get("content", ""),
+        int(timestamp) // 60,
+        message.get("status", "sent"),
+        message.get("role", "user"),
+        message.get("avatar_url") or _default_avatar(username),
+        message.get("thread_count", 0),
+        username == current_user,
+        reactions_key,
+    )
+
+
+@functools.lru_cache(maxsize=2048)
+def _bubble_html(username: str, content: str, ts_minute: int, status: str, role: str,
+                 avatar_url: str, thread_count: int, is_current_user: bool,
+                 reactions_key: tuple) -> str:
+    """Escape and assemble one bubble; re-renders of unchanged messages are a cache hit"""
+    username = escape(username)
+    content = escape(content)
+    time_str = _fmt_time(ts_minute)
     
     # Determine bubble type
-    is_current_user = username == current_user
     is_system = role == "system"
     
     if is_system:
@@ -333,60 +380,67 @@ def render_message_bubble(message: Dict, current_user: str):
     else:
         bubble_class = "message-bubble-other"
     
+    show_avatar = not is_system
+    avatar_html = f'<img src="{escape(avatar_url)}" class="message-avatar" alt="{username}">' if show_avatar else ''
+    
     # Build HTML
-    html = f'<div class="{bubble_class}">'
+    parts = [f'<div class="{bubble_class}">']
     
     # Avatar (for other users)
-    if not is_current_user and not is_system:
-        html += f'<img src="{avatar_url}" class="message-avatar" alt="{username}">'
+    if show_avatar and not is_current_user:
+        parts.append(avatar_html)
     
     # Bubble content
-    html += '<div class="bubble-wrapper">'
-    
-    if not is_system:
-        html += f'<div class="message-username">{username}</div>'
-    
-    html += f'<div class="bubble-content">{content}</div>'
+    if is_system:
+        parts.append(f'<div class="bubble-wrapper"><div class="bubble-content">{content}</div>')
+    else:
+        parts.append(
+            f'<div class="bubble-wrapper"><div class="message-username">{username}</div>'
+            f'<div class="bubble-content">{content}</div>'
+        )
     
     # Meta info
-    html += f'<div class="message-meta">'
-    html += f'<span>{time_str}</span>'
-    
     if is_current_user:
-        html += f'<span class="message-status status-{status}"></span>'
-    
-    html += '</div>'
+        parts.append(
+            f'<div class="message-meta"><span>{time_str}</span>'
+            f'<span class="message-status status-{escape(status)}"></span></div>'
+        )
+    else:
+        parts.append(f'<div class="message-meta"><span>{time_str}</span></div>')
     
     # Reactions
-    if reactions:
-        html += '<div class="message-reactions">'
-        for emoji, users in reactions.items():
-            count = len(users)
-            is_active = current_user in users
+    if reactions_key:
+        parts.append('<div class="message-reactions">')
+        for emoji, count, is_active in reactions_key:
             active_class = "active" if is_active else ""
-            html += f'<span class="reaction-pill {active_class}">{emoji} {count}</span>'
-        html += '</div>'
+            parts.append(f'<span class="reaction-pill {active_class}">{escape(emoji)} {count}</span>')
+        parts.append('</div>')
     
     # Thread indicator
     if thread_count > 0:
-        html += f'<div class="thread-indicator">💬 {thread_count} replies</div>'
+        parts.append(f'<div class="thread-indicator">💬 {thread_count} replies</div>')
     
-    html += '</div>'  # bubble-wrapper
+    parts.append('</div>')  # bubble-wrapper
     
     # Avatar (for current user)
-    if is_current_user and not is_system:
-        html += f'<img src="{avatar_url}" class="message-avatar" alt="{username}">'
+    if show_avatar and is_current_user:
+        parts.append(avatar_html)
     
-    html += '</div>'  # message-bubble
+    parts.append('</div>')  # message-bubble
     
-    st.markdown(html, unsafe_allow_html=True)
+    return ''.join(parts)
 
 
-def render_typing_indicator(username: str):
-    """Render typing indicator"""
-    html = f'''
+def render_message_bubble(message: Dict, current_user: str):
+    """Render a single message bubble"""
+    st.markdown(message_bubble_html(message, current_user), unsafe_allow_html=True)
+
+
+def typing_indicator_html(username: str) -> str:
+    """Build the HTML for a typing indicator"""
+    return f'''
     <div class="typing-indicator">
-        <strong>{username}</strong> is typing
+        <strong>{escape(username)}</strong> is typing
         <div class="typing-dots">
             <div class="typing-dot"></div>
             <div class="typing-dot"></div>
@@ -394,7 +448,11 @@ def render_typing_indicator(username: str):
         </div>
     </div>
     '''
-    st.markdown(html, unsafe_allow_html=True)
+
+
+def render_typing_indicator(username: str):
+    """Render typing indicator"""
+    st.markdown(typing_indicator_html(username), unsafe_allow_html=True)
 
 
 def render_unread_badge(count: int):
@@ -406,28 +464,27 @@ def render_unread_badge(count: int):
 
 # ==================== Input Components ====================
 
+_COMMON_EMOJIS = ("😊", "👍", "❤️", "🎉", "🚀", "💡", "🔥", "✨", "👏", "🙌")
+_REACTION_EMOJIS = ("👍", "❤️", "😂", "🎉", "🚀", "💡")
+
+
 def render_suggested_replies(suggestions: List[str]):
     """Render AI-suggested reply chips"""
     if suggestions:
-        st.markdown('<div class="suggested-replies">', unsafe_allow_html=True)
-        
+        # A markdown <div> cannot wrap widgets, so no wrapper elements here
         cols = st.columns(len(suggestions))
         for i, suggestion in enumerate(suggestions):
             with cols[i]:
                 if st.button(suggestion, key=f"suggest_{i}", use_container_width=True):
                     return suggestion
-        
-        st.markdown('</div>', unsafe_allow_html=True)
     
     return None
 
 
 def render_emoji_picker():
     """Render emoji picker"""
-    common_emojis = ["😊", "👍", "❤️", "🎉", "🚀", "💡", "🔥", "✨", "👏", "🙌"]
-    
-    cols = st.columns(len(common_emojis))
-    for i, emoji in enumerate(common_emojis):
+    cols = st.columns(len(_COMMON_EMOJIS))
+    for i, emoji in enumerate(_COMMON_EMOJIS):
         with cols[i]:
             if st.button(emoji, key=f"emoji_{i}"):
                 return emoji
@@ -437,10 +494,8 @@ def render_emoji_picker():
 
 def render_reaction_buttons(message_id: str):
     """Render reaction buttons for a message"""
-    reactions = ["👍", "❤️", "😂", "🎉", "🚀", "💡"]
-    
-    cols = st.columns(len(reactions))
-    for i, emoji in enumerate(reactions):
+    cols = st.columns(len(_REACTION_EMOJIS))
+    for i, emoji in enumerate(_REACTION_EMOJIS):
         with cols[i]:
             if st.button(emoji, key=f"react_{message_id}_{i}"):
                 return emoji
@@ -450,20 +505,45 @@ def render_reaction_buttons(message_id: str):
 
 # ==================== Chat Container ====================
 
+# Above this many messages the chat is rendered in a components.html iframe
+_IFRAME_THRESHOLD = 100
+
+
+def chat_container_html(messages: List[Dict], current_user: str,
+                        typing_user: Optional[str] = None) -> str:
+    """Build the HTML for the chat container and all of its messages"""
+    parts = ['<div class="chat-container">']
+    for message in messages:
+        parts.append(message_bubble_html(message, current_user))
+    
+    if typing_user:
+        parts.append(typing_indicator_html(typing_user))
+    
+    parts.append('</div>')
+    return ''.join(parts)
+
+
 def render_chat_container(messages: List[Dict], current_user: str, 
                          show_typing: bool = False, typing_user: str = None):
-    """Render complete chat container with messages"""
-    inject_chat_css()
+    """
+    Render complete chat container with messages
+
+    Deliberately not an st.fragment: the container holds no widgets, so it
+    would never get a fragment-scoped rerun, and full-app reruns execute
+    fragments anyway (with the arguments captured at their first call).
+    """
+    html = chat_container_html(messages, current_user, typing_user if show_typing else None)
     
-    st.markdown('<div class="chat-container">', unsafe_allow_html=True)
+    if len(messages) > _IFRAME_THRESHOLD:
+        # Long chats go out as one static iframe the browser renders natively,
+        # skipping markdown parsing and React reconciliation of the whole tree
+        components.html(_CHAT_CSS + html, height=600, scrolling=True)
+        return
     
-    for message in messages:
-        render_message_bubble(message, current_user)
-    
-    if show_typing and typing_user:
-        render_typing_indicator(typing_user)
+    inject_chat_css()
     
-    st.markdown('</div>', unsafe_allow_html=True)
+    # Ship the container and every bubble as one markdown element
+    st.markdown(html, unsafe_allow_html=True)
 
 
 # ==================== Media Handling ====================
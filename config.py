@@ -16,9 +16,10 @@ DB_PATH = os.path.join(DATA_DIR, "community_chats.db")
 LOGS_DIR = os.path.join(DATA_DIR, "logs")
 CACHE_DIR = os.path.join(DATA_DIR, "cache")
 
-# Create all required directories if not exist
-for path in [DATA_DIR, FAISS_DIR, LOGS_DIR, CACHE_DIR]:
-    os.makedirs(path, exist_ok=True)
+# Create all required directories if not exist (one stat each once they do)
+for path in (DATA_DIR, FAISS_DIR, LOGS_DIR, CACHE_DIR):
+    if not os.path.isdir(path):
+        os.makedirs(path, exist_ok=True)
 
 # --------------------------------------------------
 # 🔗 Firebase Configuration
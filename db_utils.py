@@ -4,53 +4,102 @@ from typing import List, Dict
 from datetime import datetime
 import firebase_admin
 from firebase_admin import credentials, db
+import atexit
+import threading
+import time
 import uuid
 import streamlit as st
 import json
+from analytics import message_counter_updates
+from push_keys import generate_push_key
+from concurrent.futures import ThreadPoolExecutor
 
 # ----------------------------
 # SQLite Initialization (optional)
 # ----------------------------
+# One long-lived autocommit connection in WAL mode, shared by every helper;
+# _sqlite_lock serializes access since it is used across threads.
+_sqlite_conn = None
+_sqlite_lock = threading.Lock()
+
+
+def _get_sqlite_conn() -> sqlite3.Connection:
+    global _sqlite_conn
+    if _sqlite_conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=134217728")
+        _sqlite_conn = conn
+    return _sqlite_conn
+
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS chats (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            community TEXT,
-            role TEXT,
-            content TEXT,
-            user_id TEXT,
-            metadata TEXT DEFAULT '',
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-    conn.close()
+    with _sqlite_lock:
+        conn = _get_sqlite_conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                community TEXT,
+                role TEXT,
+                content TEXT,
+                user_id TEXT,
+                metadata TEXT DEFAULT '',
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chats_community_id ON chats(community, id DESC)")
 
 # ----------------------------
-# Firebase Initialization
+# Firebase Initialization (lazy)
 # ----------------------------
-if not firebase_admin._apps:
-    cred = credentials.Certificate("firebase-service-key.json")
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': 'https://revolution-7a48d-default-rtdb.firebaseio.com/'
-    })
+# The service key is only read on the first call that needs the database,
+# so importing this module stays cheap for tools that never touch Firebase.
+_firebase_lock = threading.Lock()
+_firebase_ready = False
+
+
+def ensure_firebase():
+    """Initialize the default Firebase app once, on first use."""
+    global _firebase_ready
+    if _firebase_ready:
+        return
+    with _firebase_lock:
+        if not firebase_admin._apps:
+            cred = credentials.Certificate("firebase-service-key.json")
+            firebase_admin.initialize_app(cred, {
+                'databaseURL': 'https://revolution-7a48d-default-rtdb.firebaseio.com/'
+            })
+        _firebase_ready = True
 
 # ----------------------------
 # User Profile / Unique ID
 # ----------------------------
+# Process-wide username -> user ID map, shared across Streamlit sessions.
+# IDs never change once assigned, so entries never expire.
+_USER_ID_CACHE: Dict[str, str] = {}
+_USER_ID_LOCK = threading.Lock()
+
+
 def get_user_profile(username: str) -> str:
     """
     Returns a unique user ID for the given username.
     Stores it in Firebase under 'users/{username}' if not already present.
-    Also caches in Streamlit session for faster reuse.
+    Also caches in Streamlit session and a process-wide map for faster reuse.
     """
+    ensure_firebase()
     if "user_ids" not in st.session_state:
         st.session_state.user_ids = {}
 
     if username in st.session_state.user_ids:
         return st.session_state.user_ids[username]
 
+    user_id = _USER_ID_CACHE.get(username)
+    if user_id is not None:
+        st.session_state.user_ids[username] = user_id
+        return user_id
+
     # Check Firebase for existing user ID
     ref = db.reference(f"users/{username}")
     user_data = ref.get()
@@ -60,23 +109,119 @@ def get_user_profile(username: str) -> str:
         user_id = str(uuid.uuid4())
         ref.set({"id": user_id, "created_at": datetime.now().isoformat()})
 
-    # Cache locally
+    # Cache locally and process-wide
+    with _USER_ID_LOCK:
+        user_id = _USER_ID_CACHE.setdefault(username, user_id)
     st.session_state.user_ids[username] = user_id
     return user_id
 
+# ----------------------------
+# Deferred Message Writes
+# ----------------------------
+# add_message queues messages under client-generated push keys and a single
+# background worker commits everything pending, together with the
+# analytics message counters, in one multi-path update.
+# Messages stay in _pending_msgs until their update commits, and
+# fetch_messages merges them into its results, so readers see their own
+# writes without waiting on (or triggering) a flush.
+_pending_msgs: Dict[str, Dict] = {}
+_pending_lock = threading.Lock()
+_message_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-writer")
+
+# A failed batch is retried in place, then left pending and flushed again
+# after FLUSH_REQUEUE_DELAY_SECONDS (never dropped).
+FLUSH_ATTEMPTS = 3
+FLUSH_RETRY_BACKOFF_SECONDS = 0.5
+FLUSH_REQUEUE_DELAY_SECONDS = 5
+
+
+def flush_messages():
+    """
+    Commit all queued messages (and their counters) to Firebase in one update() call.
+    Runs on the single chat-writer thread (and once more at exit), so
+    flushes never overlap; no lock is held across the network calls.
+    """
+    ensure_firebase()
+    with _pending_lock:
+        if not _pending_msgs:
+            return
+        batch = dict(_pending_msgs)
+
+    # chats/{community}/{key} -> bump that community's counters in the same write
+    counters = message_counter_updates([
+        (path.split("/")[1], msg.get("username")) for path, msg in batch.items()
+    ])
+
+    for attempt in range(1, FLUSH_ATTEMPTS + 1):
+        try:
+            db.reference("/").update({**batch, **counters})
+            break
+        except Exception as e:
+            print(f"❌ Error flushing {len(batch)} messages (attempt {attempt}/{FLUSH_ATTEMPTS}): {e}")
+            if attempt < FLUSH_ATTEMPTS:
+                time.sleep(FLUSH_RETRY_BACKOFF_SECONDS * attempt)
+    else:
+        # Still failing: the batch stays pending; try again later
+        retry = threading.Timer(FLUSH_REQUEUE_DELAY_SECONDS, _submit_flush)
+        retry.daemon = True
+        retry.start()
+        return
+
+    with _pending_lock:
+        for path in batch:
+            _pending_msgs.pop(path, None)
+
+
+def _submit_flush():
+    """Schedule flush_messages on the writer thread (no-op once it has shut down)."""
+    try:
+        _message_writer.submit(flush_messages)
+    except RuntimeError:
+        pass
+
+
+@atexit.register
+def _flush_messages_on_exit():
+    """Finish queued flushes, then commit anything still pending before exit."""
+    _message_writer.shutdown(wait=True)
+    flush_messages()
+
+
+def _pending_rows(community: str) -> Dict[str, Dict]:
+    """Queued messages for `community` that may not be committed yet, by key."""
+    prefix = f"chats/{community}/"
+    with _pending_lock:
+        return {
+            path[len(prefix):]: msg for path, msg in _pending_msgs.items()
+            if path.startswith(prefix)
+        }
+
+
 # ----------------------------
 # Firebase Chat Utilities
 # ----------------------------
+_ref_cache: Dict[str, db.Reference] = {}
+
+
+def _chat_ref(community: str) -> db.Reference:
+    """Return the (cached) Reference for a community's chat node."""
+    ref = _ref_cache.get(community)
+    if ref is None:
+        ref = _ref_cache[community] = db.reference(f"chats/{community}")
+    return ref
+
+
 def add_message(community: str, username: str, content: str, role: str = "user") -> str:
     """
     Add a message to a community chat in Firebase.
     Uses the user's unique ID and stores username mapping.
+    The write itself is committed in the background (see flush_messages).
     """
     content = content or ""
     role = role or "user"
     user_id = get_user_profile(username)
 
-    ref = db.reference(f"chats/{community}")
+    key = generate_push_key()
     new_msg = {
         "role": role,
         "user_id": user_id,
@@ -84,9 +229,10 @@ def add_message(community: str, username: str, content: str, role: str = "user")
         "content": content,
         "timestamp": datetime.now().timestamp()
     }
-    msg_ref = ref.push(new_msg)
-    print(f"✅ Message added to {community}: {content} (user_id: {user_id})")
-    return msg_ref.key
+    with _pending_lock:
+        _pending_msgs[f"chats/{community}/{key}"] = new_msg
+    _submit_flush()
+    return key
 
 def fetch_messages(community: str, limit: int = 100) -> List[Dict]:
     """
@@ -94,8 +240,16 @@ def fetch_messages(community: str, limit: int = 100) -> List[Dict]:
     Returns a list of dicts with keys: id, role, user_id, username, content.
     """
     try:
-        ref = db.reference(f"chats/{community}")
-        data = ref.order_by_key().limit_to_last(limit).get()
+        ensure_firebase()
+        ref = _chat_ref(community)
+        data = ref.order_by_key().limit_to_last(limit).get() or {}
+
+        # Merge messages whose background write hasn't committed yet
+        pending = _pending_rows(community)
+        if pending:
+            data = dict(data)
+            data.update(pending)
+            data = {k: data[k] for k in sorted(data)[-limit:]}
         if not data:
             return []
 
@@ -107,44 +261,56 @@ def fetch_messages(community: str, limit: int = 100) -> List[Dict]:
                 "username": v.get("username", "Unknown"),
                 "content": v.get("content", "")
             }
-            for k, v in sorted(data.items())
+            # Ordered queries come back as an OrderedDict already sorted
+            # by key, and push keys sort chronologically
+            for k, v in data.items()
         ]
         return rows
     except Exception as e:
         print(f"❌ Error fetching messages: {e}")
         return []
 
+_fetch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="chat-read")
+
+
+def fetch_many(communities: List[str], limit: int = 100) -> Dict[str, List[Dict]]:
+    """
+    Fetch the last N messages for several communities concurrently.
+    Returns a dict of community -> rows (same shape as fetch_messages).
+    """
+    communities = list(dict.fromkeys(communities))
+    results = _fetch_executor.map(lambda c: fetch_messages(c, limit), communities)
+    return dict(zip(communities, results))
+
 # ----------------------------
 # Optional SQLite Utilities
 # ----------------------------
 def get_last_id(community: str) -> int:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT id FROM chats WHERE community=? ORDER BY id DESC LIMIT 1", (community,))
-    r = cur.fetchone()
-    conn.close()
+    with _sqlite_lock:
+        r = _get_sqlite_conn().execute(
+            "SELECT id FROM chats WHERE community=? ORDER BY id DESC LIMIT 1", (community,)
+        ).fetchone()
     return r[0] if r else 0
 
 def export_community_json(community: str, path: str):
+    # fetch_messages already returns the export shape; stream the records
+    # out one at a time instead of copying the list and encoding it whole
     rows = fetch_messages(community, limit=10000)
-    data = [
-        {
-            "id": r["id"],
-            "role": r["role"],
-            "user_id": r["user_id"],
-            "username": r["username"],
-            "content": r["content"]
-        } for r in rows
-    ]
     with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write("[")
+        for i, r in enumerate(rows):
+            if i:
+                f.write(",\n")
+            json.dump(r, f, ensure_ascii=False)
+        f.write("]")
 
 def clear_community(community: str):
     """
     Clears all messages for a given community from Firebase.
     """
     try:
-        ref = db.reference(f"chats/{community}")
+        ensure_firebase()
+        ref = _chat_ref(community)
         ref.delete()
         print(f"⚠️ Cleared all messages in {community}")
     except Exception as e:
@@ -4,14 +4,17 @@ import os
 import time
 import json
 from typing import List, Dict
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, BackgroundTasks, Depends
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import httpx
 import asyncio
+import multiprocessing
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
 
-from db_utils import init_db, add_message, fetch_messages
+from db_utils import init_db, add_message, fetch_messages, ensure_firebase
 from kb_utils import add_to_kb, search_kb
 from config import DB_PATH
 from opportunity_matcher import (
@@ -29,15 +32,18 @@ from analytics import (
 from multi_tenant import (
     create_organization, get_organization, add_member_to_organization,
     is_member, check_permission, create_invite_code, use_invite_code,
-    get_user_organizations
+    get_user_organizations, purge_expired_invites
 )
 
 # Import auth functions directly to avoid circular dependency
 import jwt
 import bcrypt
 import secrets
-from datetime import datetime, timedelta
+import hashlib
+from datetime import datetime, timezone
 from firebase_admin import db as firebase_db
+from auth_manager import BCRYPT_ROUNDS, email_index_key, email_registered, start_session_sweeper
+from ttl_cache import TTLCache
 
 # ------------------------------------------
 # 🔰 Load environment
@@ -52,13 +58,18 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 REFRESH_TOKEN_EXPIRE_DAYS = 30
 
+# Verified JWT payloads, keyed by a digest of the token
+JWT_CACHE_TTL_SECONDS = 30
+JWT_CACHE_MAXSIZE = 10000
+_jwt_cache = TTLCache(JWT_CACHE_MAXSIZE, clock=time.time)  # {digest: payload}
+
 
 # ------------------------------------------
 # 🔐 Auth Helper Functions
 # ------------------------------------------
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -74,25 +85,106 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
-def create_access_token(data: dict) -> str:
+# Dedicated bcrypt workers, started in lifespan() and sized to the machine
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 1)))
+_bcrypt_pool = None
+
+
+async def _run_bcrypt(fn, *args):
+    """Run a bcrypt helper on the process pool (worker thread before startup)"""
+    if _bcrypt_pool is None:
+        return await asyncio.to_thread(fn, *args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_pool, fn, *args)
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password off the event loop so login bursts use every core"""
+    return await _run_bcrypt(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password off the event loop so login bursts use every core"""
+    return await _run_bcrypt(verify_password, plain_password, hashed_password)
+
+
+def _utc_iso(ts: float) -> str:
+    """Naive-UTC ISO string for an epoch timestamp (same format as utcnow().isoformat())"""
+    return datetime.fromtimestamp(ts, tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def create_access_token(data: dict, now: float = None) -> str:
     """Create a JWT access token"""
+    now = int(now if now is not None else time.time())
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire, "iat": datetime.utcnow(), "type": "access"})
+    to_encode.update({"exp": now + ACCESS_TOKEN_EXPIRE_MINUTES * 60, "iat": now, "type": "access"})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def create_refresh_token(data: dict) -> str:
+def create_refresh_token(data: dict, now: float = None) -> str:
     """Create a JWT refresh token"""
+    now = int(now if now is not None else time.time())
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire, "iat": datetime.utcnow(), "type": "refresh"})
+    to_encode.update({"exp": now + REFRESH_TOKEN_EXPIRE_DAYS * 86400, "iat": now, "type": "refresh"})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def verify_token_cached(token: str) -> dict:
+    """
+    Decode and verify a JWT, reusing the payload for up to
+    JWT_CACHE_TTL_SECONDS (never past the token's own exp).
+    Raises the same jwt exceptions as jwt.decode on a miss.
+    """
+    key = hashlib.sha256(token.encode('utf-8')).digest()[:16]
+    cached = _jwt_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+    
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        _jwt_cache.set(key, dict(payload), expires_at=min(time.time() + JWT_CACHE_TTL_SECONDS, exp))
+    
+    return payload
+
+# Expired invite codes are deleted on this interval while the server runs
+INVITE_PURGE_INTERVAL_SECONDS = int(os.getenv("INVITE_PURGE_INTERVAL_SECONDS", "3600"))
+
+
+async def _purge_invites_forever():
+    """Background task: purge expired invite codes every INVITE_PURGE_INTERVAL_SECONDS"""
+    while True:
+        removed = await asyncio.to_thread(purge_expired_invites)
+        if removed:
+            print(f"🧹 Purged {removed} expired invite codes")
+        await asyncio.sleep(INVITE_PURGE_INTERVAL_SECONDS)
+
+
 # ------------------------------------------
 # 🚀 FastAPI App Initialization
 # ------------------------------------------
-app = FastAPI(title="Community Chat Hub - Realtime AI Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup/shutdown work, kept out of import time so workers boot concurrently"""
+    global _bcrypt_pool
+    # Firebase (the routes below use firebase_db directly) and local SQLite
+    ensure_firebase()
+    init_db()
+    _get_gemini_client()
+    # spawn, not fork: Firebase and httpx threads are already running here
+    _bcrypt_pool = ProcessPoolExecutor(
+        max_workers=BCRYPT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+    invite_purge = asyncio.create_task(_purge_invites_forever())
+    start_session_sweeper()
+    yield
+    invite_purge.cancel()
+    await _close_gemini_client()
+    pool, _bcrypt_pool = _bcrypt_pool, None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="Community Chat Hub - Realtime AI Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -102,37 +194,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize local SQLite
-init_db()
-
 # ------------------------------------------
 # 💬 WebSocket Connection Manager
 # ------------------------------------------
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: dict[str, List[WebSocket]] = {}
+        self.active_connections: dict[str, set[WebSocket]] = {}
 
     async def connect(self, community: str, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.setdefault(community, []).append(websocket)
+        self.active_connections.setdefault(community, set()).add(websocket)
         print(f"🔗 {community}: client connected")
 
     def disconnect(self, community: str, websocket: WebSocket):
-        conns = self.active_connections.get(community, [])
+        conns = self.active_connections.get(community, set())
         if websocket in conns:
-            conns.remove(websocket)
+            conns.discard(websocket)
             print(f"❌ {community}: client disconnected")
 
     async def broadcast(self, community: str, message: dict):
-        conns = self.active_connections.get(community, [])
-        alive = []
-        for ws in conns:
-            try:
-                await ws.send_json(message)
-                alive.append(ws)
-            except Exception:
-                pass
-        self.active_connections[community] = alive
+        conns = list(self.active_connections.get(community, ()))
+        if not conns:
+            return
+        # Serialize once (same encoding as send_json), then send to every
+        # subscriber concurrently; drop the ones that fail
+        payload = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+        results = await asyncio.gather(
+            *(ws.send_text(payload) for ws in conns), return_exceptions=True
+        )
+        dead = {ws for ws, r in zip(conns, results) if isinstance(r, Exception)}
+        if dead:
+            self.active_connections[community] -= dead
 
 
 manager = ConnectionManager()
@@ -229,25 +321,22 @@ async def root():
 async def api_register(data: RegisterIn):
     """Register a new user"""
     try:
-        ref = firebase_db.reference('users')
-        
-        # Check if user exists
-        users = ref.get() or {}
-        if data.username in users:
+        # Check if user exists (keys only, not the profile payload)
+        if firebase_db.reference(f'users/{data.username}').get(shallow=True):
             return {"ok": False, "error": "Username already exists"}
         
-        # Check email uniqueness
-        for user_data in users.values():
-            if user_data.get('email') == data.email:
-                return {"ok": False, "error": "Email already registered"}
+        # Check email uniqueness (users_by_email index)
+        if email_registered(data.email):
+            return {"ok": False, "error": "Email already registered"}
+        email_key = email_index_key(data.email)
         
         # Create user
         user_data = {
             "username": data.username,
             "email": data.email,
-            "password_hash": hash_password(data.password),
+            "password_hash": await hash_password_async(data.password),
             "full_name": data.full_name,
-            "created_at": datetime.utcnow().isoformat(),
+            "created_at": _utc_iso(time.time()),
             "is_active": True,
             "is_verified": False,
             "avatar_url": f"https://ui-avatars.com/api/?name={data.username}&background=random",
@@ -255,7 +344,11 @@ async def api_register(data: RegisterIn):
             "last_login": None
         }
         
-        ref.child(data.username).set(user_data)
+        # User record and email index land in one atomic multi-path update
+        firebase_db.reference().update({
+            f'users/{data.username}': user_data,
+            f'users_by_email/{email_key}': data.username
+        })
         
         return {
             "ok": True,
@@ -283,29 +376,35 @@ async def api_login(data: LoginIn):
             return {"ok": False, "error": "Account is deactivated"}
         
         # Verify password
-        if not verify_password(data.password, user_data['password_hash']):
+        if not await verify_password_async(data.password, user_data['password_hash']):
             return {"ok": False, "error": "Invalid username or password"}
         
-        # Update last login
-        ref.update({"last_login": datetime.utcnow().isoformat()})
+        # One clock read for every timestamp this login produces
+        now = time.time()
+        now_iso = _utc_iso(now)
         
         # Remove password hash from returned data
         user_data.pop('password_hash', None)
         
         # Create tokens
-        access_token = create_access_token({"sub": data.username})
-        refresh_token = create_refresh_token({"sub": data.username})
+        access_token = create_access_token({"sub": data.username}, now)
+        refresh_token = create_refresh_token({"sub": data.username}, now)
         
         # Create session
         session_id = secrets.token_urlsafe(32)
         session_data = {
             "session_id": session_id,
             "username": data.username,
-            "created_at": datetime.utcnow().isoformat(),
-            "expires_at": (datetime.utcnow() + timedelta(hours=24)).isoformat(),
+            "created_at": now_iso,
+            "expires_at": now + 24 * 60 * 60,
             "is_active": True
         }
-        firebase_db.reference(f'sessions/{session_id}').set(session_data)
+        
+        # last_login and the new session go out in one multi-path update
+        firebase_db.reference().update({
+            f'users/{data.username}/last_login': now_iso,
+            f'sessions/{session_id}': session_data
+        })
         
         return {
             "ok": True,
@@ -332,7 +431,7 @@ async def api_logout():
 async def api_refresh_token(data: RefreshTokenIn):
     """Refresh access token"""
     try:
-        payload = jwt.decode(data.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = verify_token_cached(data.refresh_token)
         
         if payload.get("type") != "refresh":
             return {"ok": False, "error": "Invalid refresh token"}
@@ -344,7 +443,7 @@ async def api_refresh_token(data: RefreshTokenIn):
         
     except jwt.ExpiredSignatureError:
         return {"ok": False, "error": "Token has expired"}
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         return {"ok": False, "error": "Invalid token"}
     except Exception as e:
         return {"ok": False, "error": str(e)}
@@ -359,6 +458,28 @@ async def api_get_current_user():
 # ------------------------------------------
 # 🤖 Helper: Gemini API call
 # ------------------------------------------
+# One pooled client for every Gemini call, so keep-alive connections (and
+# their TLS sessions) are reused instead of re-handshaking per request
+_gemini_client: httpx.AsyncClient = None
+
+
+def _get_gemini_client() -> httpx.AsyncClient:
+    global _gemini_client
+    if _gemini_client is None:
+        _gemini_client = httpx.AsyncClient(
+            timeout=60,
+            limits=httpx.Limits(max_keepalive_connections=32),
+        )
+    return _gemini_client
+
+
+async def _close_gemini_client():
+    global _gemini_client
+    if _gemini_client is not None:
+        await _gemini_client.aclose()
+        _gemini_client = None
+
+
 async def call_gemini(prompt: str, timeout: int = 40) -> str:
     if not GEMINI_API_KEY:
         return "⚠️ Gemini API key not configured."
@@ -368,11 +489,10 @@ async def call_gemini(prompt: str, timeout: int = 40) -> str:
     payload = {"contents": [{"parts": [{"text": prompt}]}]}
 
     try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            r = await client.post(url, headers=headers, json=payload)
-            r.raise_for_status()
-            data = r.json()
-            return data["candidates"][0]["content"]["parts"][0]["text"]
+        r = await _get_gemini_client().post(url, headers=headers, json=payload, timeout=timeout)
+        r.raise_for_status()
+        data = r.json()
+        return data["candidates"][0]["content"]["parts"][0]["text"]
     except Exception as e:
         print("❌ Gemini error:", e)
         return f"(Gemini error: {e})"
@@ -383,13 +503,12 @@ async def call_gemini(prompt: str, timeout: int = 40) -> str:
 # ------------------------------------------
 async def background_summarize_and_add(community: str):
     """Fetch recent messages, summarize them, and add summary to KB."""
-    rows = fetch_messages(community, limit=200)
+    # limit_to_last(100) on the server; no over-fetch and re-slice here
+    rows = fetch_messages(community, limit=100)
     if not rows:
         return
 
-    chat_text = "\n".join(
-        [f"{r['username']}: {r['content']}" for r in rows[-100:]]
-    )
+    chat_text = "\n".join(f"{r['username']}: {r['content']}" for r in rows)
 
     prompt = (
         "Summarize the following community chat into short bullet points and key insights:\n\n"
@@ -412,11 +531,47 @@ async def background_summarize_and_add(community: str):
         print("⚠️ Background summarization failed:", e)
 
 
+# Bursts of messages are coalesced into one summarization per community:
+# a run is scheduled SUMMARY_DELAY_SECONDS after a message, at most once per
+# SUMMARY_COOLDOWN_SECONDS, and only after SUMMARY_MIN_NEW_MESSAGES arrived.
+SUMMARY_DELAY_SECONDS = 10
+SUMMARY_COOLDOWN_SECONDS = 60
+SUMMARY_MIN_NEW_MESSAGES = 5
+
+_summary_tasks: Dict[str, asyncio.Task] = {}
+_last_summary_at: Dict[str, float] = {}
+_new_message_counts: Dict[str, int] = {}
+
+
+async def _summarize_after_delay(community: str):
+    try:
+        await asyncio.sleep(SUMMARY_DELAY_SECONDS)
+        _new_message_counts[community] = 0
+        _last_summary_at[community] = time.monotonic()
+        await background_summarize_and_add(community)
+    finally:
+        _summary_tasks.pop(community, None)
+
+
+def schedule_summary(community: str):
+    """Count a new message and start a delayed summary run if one is due."""
+    _new_message_counts[community] = _new_message_counts.get(community, 0) + 1
+
+    if community in _summary_tasks:
+        return
+    if _new_message_counts[community] < SUMMARY_MIN_NEW_MESSAGES:
+        return
+    if time.monotonic() - _last_summary_at.get(community, float("-inf")) < SUMMARY_COOLDOWN_SECONDS:
+        return
+
+    _summary_tasks[community] = asyncio.create_task(_summarize_after_delay(community))
+
+
 # ------------------------------------------
 # 📩 API: Send message
 # ------------------------------------------
 @app.post("/api/send")
-async def api_send(chat: ChatIn, background_tasks: BackgroundTasks):
+async def api_send(chat: ChatIn):
     """Receive chat message, broadcast to all, and trigger summarization."""
     msg_id = add_message(chat.community, chat.username, chat.content, chat.role)
     payload = {"id": msg_id, "role": chat.role, "username": chat.username, "content": chat.content}
@@ -424,8 +579,8 @@ async def api_send(chat: ChatIn, background_tasks: BackgroundTasks):
     # broadcast new message
     await manager.broadcast(chat.community, payload)
 
-    # Schedule background summarization (async)
-    background_tasks.add_task(background_summarize_and_add, chat.community)
+    # Schedule background summarization (coalesced per community)
+    schedule_summary(chat.community)
 
     return {"ok": True, "id": msg_id}
 
@@ -448,17 +603,22 @@ async def websocket_endpoint(websocket: WebSocket, community: str):
     """Open real-time connection for a community chat."""
     await manager.connect(community, websocket)
     try:
-        # On connect, send history
+        # On connect, send history as a single frame
         messages = fetch_messages(community, limit=100)
-        for m in messages:
-            await websocket.send_json(
-                {
-                    "id": m.get("id"),
-                    "role": m.get("role"),
-                    "username": m.get("username"),
-                    "content": m.get("content"),
-                }
-            )
+        await websocket.send_json(
+            {
+                "type": "history",
+                "messages": [
+                    {
+                        "id": m.get("id"),
+                        "role": m.get("role"),
+                        "username": m.get("username"),
+                        "content": m.get("content"),
+                    }
+                    for m in messages
+                ],
+            }
+        )
 
         # Keep the connection alive
         while True:
@@ -506,14 +666,6 @@ Knowledge Base Context:
     return {"answer": answer, "context": context}
 
 
-# ------------------------------------------
-# 🏁 Root Endpoint
-# ------------------------------------------
-@app.get("/")
-def root():
-    return {"status": "ok", "message": "Community Chat AI Backend is running ✅"}
-
-
 # ------------------------------------------
 # 🎯 Opportunity Matching Endpoints
 # ------------------------------------------
@@ -1,10 +1,11 @@
 import firebase_admin
 from firebase_admin import credentials, db
 
-cred = credentials.Certificate("firebase-service-key.json")  # download from Firebase console
-firebase_admin.initialize_app(cred, {
-    'databaseURL': 'https://revolution-7a48d-default-rtdb.firebaseio.com'
-})
+if not firebase_admin._apps:
+    cred = credentials.Certificate("firebase-service-key.json")  # download from Firebase console
+    firebase_admin.initialize_app(cred, {
+        'databaseURL': 'https://revolution-7a48d-default-rtdb.firebaseio.com'
+    })
 
 def create_user_profile(uid, name, email, interests=None, experience=None, achievements=None):
     ref = db.reference(f"users/{uid}")
@@ -1,12 +1,139 @@
 from firebase_admin import db
-import uuid
-from difflib import SequenceMatcher
+import math
+import re
+import threading
+import time
+import numpy as np
+from collections import Counter, defaultdict
 from datetime import datetime
+from analytics import kb_counter_updates
+from push_keys import generate_push_key
 
 # ============================================================
 # Global Cache
 # ============================================================
-_kb_store = {}  # {community: {"store": [doc1, doc2, ...]}}
+_kb_store = {}  # {community: {"store": [doc1, doc2, ...], "index": {...} | None}}
+
+_kb_locks = {}  # {community: threading.Lock} guarding _kb_store[community]
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Progress/trace output for KB operations (errors and warnings always print)
+_DEBUG = False
+
+# Fully refit a community's index once it has grown this much by appends
+_INDEX_REFIT_RATIO = 0.25
+
+# search_kb reuses a cached store for this long before re-reading Firebase
+KB_REFRESH_SECONDS = 30
+
+
+def _kb_lock(community: str) -> threading.Lock:
+    """Per-community lock for store/index mutation (setdefault is atomic)"""
+    lock = _kb_locks.get(community)
+    if lock is None:
+        lock = _kb_locks.setdefault(community, threading.Lock())
+    return lock
+
+
+# ============================================================
+# TF-IDF Index
+# ============================================================
+def _doc_lower(doc: dict) -> str:
+    """Lowercased content, precomputed at insert time (legacy docs fall back)"""
+    lowered = doc.get("content_lower")
+    if isinstance(lowered, str):
+        return lowered
+    return str(doc.get("content", "")).lower()
+
+
+def _build_index(docs: list) -> dict:
+    """
+    Build a TF-IDF inverted index over doc contents.
+    Each term maps to (doc indices, L2-normalized weights) as NumPy arrays,
+    so a query is one vectorized scatter-add per query term.
+    """
+    lowered = [_doc_lower(doc) for doc in docs]
+    term_counts = [Counter(_TOKEN_RE.findall(text)) for text in lowered]
+    doc_freq = Counter()
+    for tf in term_counts:
+        doc_freq.update(tf.keys())
+
+    n = len(docs)
+    idf = {term: math.log((1 + n) / (1 + df)) + 1.0 for term, df in doc_freq.items()}
+
+    postings = defaultdict(lambda: ([], []))
+    for i, tf in enumerate(term_counts):
+        weights = {term: count * idf[term] for term, count in tf.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        for term, w in weights.items():
+            idx_list, w_list = postings[term]
+            idx_list.append(i)
+            w_list.append(w / norm)
+
+    return {
+        "n": n,
+        "built_n": n,
+        "lowered": lowered,
+        "idf": idf,
+        "postings": {
+            term: (np.array(idx, dtype=np.intp), np.array(w, dtype=np.float64))
+            for term, (idx, w) in postings.items()
+        },
+        # Appended postings, kept as Python lists until a query needs them
+        "pending": {},
+    }
+
+
+def _index_append(index: dict, doc: dict):
+    """
+    Add one doc to an existing index without refitting.
+    IDF stays fixed from the last full build; terms the index has never
+    seen get the build-time smoothed IDF for df=1 at the current corpus
+    size. Postings are appended to Python lists in O(|doc|) and merged
+    into the arrays lazily by _postings().
+    """
+    i = index["n"]
+    index["n"] = i + 1
+    idf = index["idf"]
+    unseen_idf = math.log((1 + index["n"]) / 2) + 1.0
+
+    text = _doc_lower(doc)
+    index["lowered"].append(text)
+    tf = Counter(_TOKEN_RE.findall(text))
+    weights = {term: count * idf.get(term, unseen_idf) for term, count in tf.items()}
+    norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+
+    pending = index["pending"]
+    for term, w in weights.items():
+        idf.setdefault(term, unseen_idf)
+        idx_list, w_list = pending.setdefault(term, ([], []))
+        idx_list.append(i)
+        w_list.append(w / norm)
+
+
+def _postings(index: dict, term: str):
+    """A term's (doc indices, weights) arrays, folding in any appended postings first."""
+    postings = index["postings"]
+    appended = index["pending"].pop(term, None)
+    if appended is not None:
+        idx_list, w_list = appended
+        new_idx = np.array(idx_list, dtype=np.intp)
+        new_w = np.array(w_list, dtype=np.float64)
+        if term in postings:
+            doc_idx, doc_w = postings[term]
+            new_idx = np.concatenate((doc_idx, new_idx))
+            new_w = np.concatenate((doc_w, new_w))
+        postings[term] = (new_idx, new_w)
+    return postings[term]
+
+
+def _get_index(community: str) -> dict:
+    """Return the community's TF-IDF index, (re)building it if it is missing."""
+    entry = _kb_store[community]
+    if entry.get("index") is None:
+        entry["index"] = _build_index(entry["store"])
+    return entry["index"]
 
 
 # ============================================================
@@ -18,7 +145,8 @@ def init_kb(community: str):
     Ensures '_kb_store[community]["store"]' is always a valid list.
     """
     global _kb_store
-    print(f"\n🟡 [init_kb] Loading KB for community: '{community}'")
+    if _DEBUG:
+        print(f"\n🟡 [init_kb] Loading KB for community: '{community}'")
 
     try:
         ref = db.reference(f'knowledgebase/{community}')
@@ -26,14 +154,18 @@ def init_kb(community: str):
 
         # Handle inconsistent Firebase structures
         if isinstance(data, dict) and "store" in data and isinstance(data["store"], dict):
-            print(f"🔍 [init_kb] Converting Firebase 'store' dict → list ({len(data['store'])} items)")
+            if _DEBUG:
+                print(f"🔍 [init_kb] Converting Firebase 'store' dict → list ({len(data['store'])} items)")
             data["store"] = list(data["store"].values())
         elif "store" not in data or not isinstance(data["store"], list):
             print("⚠️ [init_kb] Missing or invalid 'store' key, resetting as empty list")
             data["store"] = []
 
-        _kb_store[community] = data
-        print(f"✅ [init_kb] KB initialized with {len(data['store'])} entries for '{community}'")
+        data["loaded_at"] = time.monotonic()
+        with _kb_lock(community):
+            _kb_store[community] = data
+        if _DEBUG:
+            print(f"✅ [init_kb] KB initialized with {len(data['store'])} entries for '{community}'")
         return data
 
     except Exception as e:
@@ -50,7 +182,8 @@ def add_to_kb(community: str, content: str, metadata: dict = None):
     Add a new document to the KB in Firebase and update the local cache.
     """
     global _kb_store
-    print(f"\n🟢 [add_to_kb] Adding document to KB for community: '{community}'")
+    if _DEBUG:
+        print(f"\n🟢 [add_to_kb] Adding document to KB for community: '{community}'")
 
     if not content or not content.strip():
         print("⚠️ [add_to_kb] Empty content — skipping insert.")
@@ -59,50 +192,61 @@ def add_to_kb(community: str, content: str, metadata: dict = None):
     if metadata is None:
         metadata = {}
 
+    content = content.strip()
     new_doc = {
-        "id": str(uuid.uuid4()),
-        "content": content.strip(),
+        "id": generate_push_key(),  # time-ordered, doubles as the Firebase key
+        "content": content,
+        "content_lower": content.lower(),
         "metadata": metadata,
         "timestamp": datetime.now().isoformat(),
     }
 
     try:
-        ref = db.reference(f'knowledgebase/{community}/store')
-        ref.push(new_doc)
-        print(f"✅ [add_to_kb] Pushed to Firebase: {new_doc['id']}")
+        # The entry and its counters commit together (see rebuild_counters)
+        db.reference().update({
+            f'knowledgebase/{community}/store/{new_doc["id"]}': new_doc,
+            **kb_counter_updates(community, metadata.get("added_by"))
+        })
+        if _DEBUG:
+            print(f"✅ [add_to_kb] Pushed to Firebase: {new_doc['id']}")
     except Exception as e:
         print(f"❌ [add_to_kb] Firebase push failed: {e}")
 
-    # Ensure local cache validity
-    if community not in _kb_store or not isinstance(_kb_store[community], dict):
-        _kb_store[community] = {"store": []}
-    if "store" not in _kb_store[community] or not isinstance(_kb_store[community]["store"], list):
-        _kb_store[community]["store"] = []
+    with _kb_lock(community):
+        # Ensure local cache validity
+        if community not in _kb_store or not isinstance(_kb_store[community], dict):
+            _kb_store[community] = {"store": []}
+        if "store" not in _kb_store[community] or not isinstance(_kb_store[community]["store"], list):
+            _kb_store[community]["store"] = []
 
-    _kb_store[community]["store"].append(new_doc)
-    print(f"📦 [add_to_kb] Added locally → Total docs in '{community}': {len(_kb_store[community]['store'])}")
+        _kb_store[community]["store"].append(new_doc)
+
+        # Extend the search index in place; refit once appends have drifted the
+        # corpus far enough from the IDF the index was built with
+        index = _kb_store[community].get("index")
+        if index is not None and index["n"] == len(_kb_store[community]["store"]) - 1:
+            if index["n"] + 1 > index["built_n"] * (1 + _INDEX_REFIT_RATIO):
+                _kb_store[community]["index"] = None
+            else:
+                _index_append(index, new_doc)
+        else:
+            _kb_store[community]["index"] = None
+    if _DEBUG:
+        print(f"📦 [add_to_kb] Added locally → Total docs in '{community}': {len(_kb_store[community]['store'])}")
     return new_doc
 
 
 # ============================================================
 # Search KB
 # ============================================================
-def search_kb(community: str, query: str, top_k: int = 3):
-    """
-    Keyword-based search in the KB using SequenceMatcher similarity.
-    Always reloads latest data from Firebase.
-    """
-    global _kb_store
-    print(f"\n🔎 [search_kb] Searching KB for community '{community}' with query: '{query}'")
-
+def _fetch_store(community: str):
+    """Read a community's KB docs from Firebase as a list (None on error)."""
     try:
         ref = db.reference(f'knowledgebase/{community}/store')
         data = ref.get()
 
         # Handle data absence or irregular format
         if not data:
-            print(f"⚠️ [search_kb] No data found in Firebase for '{community}'")
-            _kb_store[community] = {"store": []}
             return []
 
         if isinstance(data, dict):
@@ -113,34 +257,101 @@ def search_kb(community: str, query: str, top_k: int = 3):
             print(f"⚠️ [search_kb] Unexpected data type for '{community}': {type(data)}")
             docs = []
 
-        _kb_store[community] = {"store": docs}
-        print(f"📚 [search_kb] Loaded {len(docs)} docs from Firebase for '{community}'")
+        if _DEBUG:
+            print(f"📚 [search_kb] Loaded {len(docs)} docs from Firebase for '{community}'")
+        return docs
 
     except Exception as e:
         print(f"❌ [search_kb] Error fetching KB for '{community}': {e}")
-        return []
+        return None
+
 
-    docs = _kb_store.get(community, {}).get("store", [])
-    if not docs:
-        print(f"⚠️ [search_kb] No docs found after loading for '{community}'")
-        return []
+def search_kb(community: str, query: str, top_k: int = 3):
+    """
+    Keyword-based search in the KB using TF-IDF cosine similarity.
+    Reloads from Firebase when the cached store is older than KB_REFRESH_SECONDS.
+    The reload and index build run outside the community's lock; only the
+    swap and the scoring pass hold it, so they never see a half-applied
+    add_to_kb and searches never queue behind a network read.
+    """
+    global _kb_store
+    if _DEBUG:
+        print(f"\n🔎 [search_kb] Searching KB for community '{community}' with query: '{query}'")
+
+    lock = _kb_lock(community)
+    with lock:
+        cached = _kb_store.get(community)
+        valid = isinstance(cached, dict) and isinstance(cached.get("store"), list)
+        fresh = valid and time.monotonic() - cached.get("loaded_at", float("-inf")) < KB_REFRESH_SECONDS
+        base_len = len(cached["store"]) if valid else 0
+
+    if not fresh:
+        docs = _fetch_store(community)
+        if docs is None:
+            return []
+        index = _build_index(docs) if docs else None
 
-    # Compute similarity scores
-    scored_docs = []
-    for doc in docs:
-        content = doc.get("content", "")
-        score = SequenceMatcher(None, content.lower(), query.lower()).ratio()
-        scored_docs.append((score, doc))
+        with lock:
+            current = _kb_store.get(community)
+            if current is cached:
+                # Keep docs add_to_kb appended while the read was in flight
+                if valid:
+                    seen = {doc.get("id") for doc in docs}
+                    late = [doc for doc in cached["store"][base_len:] if doc.get("id") not in seen]
+                    if late:
+                        docs = docs + late
+                        index = None
+                _kb_store[community] = {"store": docs, "loaded_at": time.monotonic(), "index": index}
+            # else: another reload or init_kb swapped in first; use theirs
 
-    scored_docs.sort(key=lambda x: x[0], reverse=True)
-    results = [{"doc": doc, "score": round(score, 3)} for score, doc in scored_docs[:top_k]]
+    with lock:
+        docs = _kb_store.get(community, {}).get("store", [])
+        if not docs:
+            print(f"⚠️ [search_kb] No docs found after loading for '{community}'")
+            return []
+
+        index = _get_index(community)
+        query_lower = query.lower()
+
+        # Exact-substring hits rank first; if there are enough of them the
+        # vector scoring is skipped entirely
+        needle = query_lower.strip()
+        hits = []
+        if needle:
+            hits = [i for i, text in enumerate(index["lowered"]) if needle in text]
+            if len(hits) >= top_k:
+                results = [{"doc": docs[i], "score": 1.0} for i in hits[:top_k]]
+                if _DEBUG:
+                    print(f"✅ [search_kb] {len(hits)} exact matches for query '{query}' in '{community}'")
+                return results
+
+        # Cosine similarity between the query and every doc's TF-IDF vector
+        query_tf = Counter(_TOKEN_RE.findall(query_lower))
+        idf = index["idf"]
+        query_weights = {term: count * idf[term] for term, count in query_tf.items() if term in idf}
+        query_norm = math.sqrt(sum(w * w for w in query_weights.values())) or 1.0
+
+        scores = np.zeros(index["n"])
+        for term, qw in query_weights.items():
+            doc_idx, doc_w = _postings(index, term)
+            scores[doc_idx] += doc_w * (qw / query_norm)
+        if hits:
+            scores[hits] = 1.0
+
+        if top_k < len(scores):
+            top = np.argpartition(-scores, top_k)[:top_k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        results = [{"doc": docs[i], "score": round(float(scores[i]), 3)} for i in top]
 
-    print(f"✅ [search_kb] Found {len(results)} relevant docs for query '{query}' in '{community}'")
-    for r in results:
-        snippet = r['doc'].get('content', '')[:80]
-        print(f"   ↳ Score: {r['score']} | Content: {snippet}...")
+        if _DEBUG:
+            print(f"✅ [search_kb] Found {len(results)} relevant docs for query '{query}' in '{community}'")
+            for r in results:
+                snippet = r['doc'].get('content', '')[:80]
+                print(f"   ↳ Score: {r['score']} | Content: {snippet}...")
 
-    return results
+        return results
 
 
 # ============================================================
@@ -151,5 +362,6 @@ def get_kb_size(community: str):
     Returns the number of KB entries currently cached in memory.
     """
     size = len(_kb_store.get(community, {}).get("store", []))
-    print(f"📏 [get_kb_size] '{community}' has {size} KB entries in cache.")
+    if _DEBUG:
+        print(f"📏 [get_kb_size] '{community}' has {size} KB entries in cache.")
     return size
@@ -3,9 +3,27 @@ Modern Neumorphic UI Styles
 Ocean-inspired color palette with glassmorphism and neumorphic design
 """
 
-def get_modern_ui_css():
-    """Returns comprehensive CSS for modern neumorphic UI"""
-    return """
+import re
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+_CSS_SPACE_RE = re.compile(r"\s+")
+_CSS_PUNCT_RE = re.compile(r"\s*([{};,>])\s*")
+
+
+def _minify_css(css: str) -> str:
+    """Strip comments and layout whitespace; the style rules are unchanged"""
+    css = _CSS_COMMENT_RE.sub("", css)
+    css = _CSS_SPACE_RE.sub(" ", css)
+    css = _CSS_PUNCT_RE.sub(r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+
+# Built once at import; every caller gets the same string object
+_MODERN_UI_CSS = """
     <style>
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
     
@@ -19,6 +37,15 @@ def get_modern_ui_css():
         --white: #FFFFFF;
         --shadow-light: rgba(255, 255, 255, 0.7);
         --shadow-dark: rgba(0, 52, 89, 0.15);
+        
+        /* Shared gradients and neumorphic shadows */
+        --grad-primary: linear-gradient(135deg, var(--ocean-blue), var(--sky-blue));
+        --grad-surface: linear-gradient(145deg, #F5F7FA, #E8ECEF);
+        --grad-surface-light: linear-gradient(145deg, #FFFFFF, #F5F7FA);
+        --shadow-neuro-out: 8px 8px 16px var(--shadow-dark), -8px -8px 16px var(--shadow-light);
+        --shadow-neuro-lg: 12px 12px 24px var(--shadow-dark), -12px -12px 24px var(--shadow-light);
+        --shadow-neuro-in: inset 4px 4px 8px var(--shadow-dark), inset -4px -4px 8px var(--shadow-light);
+        --shadow-neuro-in-sm: inset 3px 3px 6px var(--shadow-dark), inset -3px -3px 6px var(--shadow-light);
     }
     
     /* ==================== GLOBAL STYLES ==================== */
@@ -32,27 +59,50 @@ def get_modern_ui_css():
     
     /* ==================== NEUMORPHIC CARDS ==================== */
     .neuro-card {
-        background: linear-gradient(145deg, #F5F7FA, #E8ECEF);
+        background: var(--grad-surface);
         border-radius: 24px;
         padding: 28px;
-        box-shadow: 
-            12px 12px 24px var(--shadow-dark),
-            -12px -12px 24px var(--shadow-light);
-        transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1);
+        box-shadow: var(--shadow-neuro-lg);
+        position: relative;
+        transition: transform 0.3s cubic-bezier(0.4, 0, 0.2, 1);
+        will-change: transform;
     }
     
     .neuro-card:hover {
+        transform: translateY(-2px);
+    }
+    
+    /* Hover shadows are pre-rendered on ::after and faded in via opacity,
+       which the compositor animates without repainting the shadow */
+    .neuro-card::after,
+    .neuro-button::after,
+    .metric-card::after {
+        content: "";
+        position: absolute;
+        inset: 0;
+        border-radius: inherit;
+        pointer-events: none;
+        opacity: 0;
+        transition: opacity 0.3s ease;
+    }
+    
+    .neuro-card:hover::after,
+    .neuro-button:hover::after,
+    .metric-card:hover::after {
+        opacity: 1;
+    }
+    
+    .neuro-card::after {
         box-shadow: 
             16px 16px 32px var(--shadow-dark),
             -16px -16px 32px var(--shadow-light);
-        transform: translateY(-2px);
     }
     
     /* ==================== GLASSMORPHIC PANELS ==================== */
     .glass-panel {
         background: rgba(255, 255, 255, 0.25);
-        backdrop-filter: blur(20px) saturate(180%);
-        -webkit-backdrop-filter: blur(20px) saturate(180%);
+        backdrop-filter: blur(8px) saturate(180%);
+        -webkit-backdrop-filter: blur(8px) saturate(180%);
         border-radius: 20px;
         border: 1px solid rgba(255, 255, 255, 0.3);
         padding: 24px;
@@ -68,13 +118,11 @@ def get_modern_ui_css():
         padding: 0;
         max-height: 700px;
         overflow: hidden;
-        box-shadow: 
-            12px 12px 24px var(--shadow-dark),
-            -12px -12px 24px var(--shadow-light);
+        box-shadow: var(--shadow-neuro-lg);
     }
     
     .chat-header {
-        background: linear-gradient(135deg, var(--ocean-blue), var(--sky-blue));
+        background: var(--grad-primary);
         padding: 20px 24px;
         border-radius: 24px 24px 0 0;
         color: white;
@@ -115,7 +163,7 @@ def get_modern_ui_css():
     }
     
     .chat-messages-area::-webkit-scrollbar-thumb {
-        background: linear-gradient(135deg, var(--ocean-blue), var(--sky-blue));
+        background: var(--grad-primary);
         border-radius: 10px;
     }
     
@@ -125,17 +173,21 @@ def get_modern_ui_css():
         align-items: flex-end;
         margin: 16px 0;
         gap: 12px;
+    }
+    
+    /* Added by the reveal script only as a message scrolls into view */
+    .message-wrapper.slide-in {
         animation: messageSlideIn 0.3s ease-out;
     }
     
     @keyframes messageSlideIn {
         from {
             opacity: 0;
-            transform: translateY(20px);
+            transform: translate3d(0, 20px, 0);
         }
         to {
             opacity: 1;
-            transform: translateY(0);
+            transform: translate3d(0, 0, 0);
         }
     }
     
@@ -153,7 +205,9 @@ def get_modern_ui_css():
         border-radius: 18px;
         position: relative;
         word-wrap: break-word;
-        transition: all 0.2s ease;
+        transition: transform 0.2s ease;
+        will-change: transform;
+        contain: layout paint style;
     }
     
     .message-bubble:hover {
@@ -170,10 +224,10 @@ def get_modern_ui_css():
             -2px -2px 8px rgba(255, 255, 255, 0.1);
     }
     
-    /* Received Messages - Glass Style */
+    /* Received Messages - flat glass look; a backdrop blur here would
+       repaint the whole scroll area on every scroll frame */
     .message-received {
         background: rgba(255, 255, 255, 0.9);
-        backdrop-filter: blur(10px);
         color: var(--deep-ocean);
         border-radius: 18px 18px 18px 4px;
         border: 1px solid rgba(0, 122, 167, 0.1);
@@ -245,7 +299,6 @@ def get_modern_ui_css():
     .chat-date-badge {
         display: inline-block;
         background: linear-gradient(135deg, rgba(0, 168, 232, 0.1), rgba(0, 126, 167, 0.1));
-        backdrop-filter: blur(10px);
         padding: 8px 16px;
         border-radius: 16px;
         font-size: 0.75em;
@@ -259,7 +312,6 @@ def get_modern_ui_css():
     /* ==================== FILE ATTACHMENT ==================== */
     .file-attachment {
         background: rgba(0, 122, 167, 0.08);
-        backdrop-filter: blur(10px);
         padding: 12px;
         border-radius: 12px;
         margin-top: 8px;
@@ -285,7 +337,7 @@ def get_modern_ui_css():
     
     /* ==================== INPUT AREA ==================== */
     .chat-input-area {
-        background: linear-gradient(145deg, #FFFFFF, #F5F7FA);
+        background: var(--grad-surface-light);
         padding: 20px 24px;
         border-radius: 0 0 24px 24px;
         border-top: 1px solid rgba(0, 122, 167, 0.1);
@@ -296,7 +348,7 @@ def get_modern_ui_css():
     
     /* ==================== BUTTONS ==================== */
     .neuro-button {
-        background: linear-gradient(135deg, var(--ocean-blue), var(--sky-blue));
+        background: var(--grad-primary);
         color: white;
         border: none;
         padding: 12px 28px;
@@ -304,7 +356,9 @@ def get_modern_ui_css():
         font-weight: 500;
         font-size: 0.95em;
         cursor: pointer;
-        transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1);
+        position: relative;
+        transition: transform 0.3s cubic-bezier(0.4, 0, 0.2, 1);
+        will-change: transform;
         box-shadow: 
             6px 6px 12px rgba(0, 122, 167, 0.3),
             -2px -2px 8px rgba(255, 255, 255, 0.1);
@@ -313,6 +367,9 @@ def get_modern_ui_css():
     
     .neuro-button:hover {
         transform: translateY(-2px);
+    }
+    
+    .neuro-button::after {
         box-shadow: 
             8px 8px 16px rgba(0, 122, 167, 0.4),
             -3px -3px 10px rgba(255, 255, 255, 0.2);
@@ -326,17 +383,15 @@ def get_modern_ui_css():
     }
     
     .neuro-button-secondary {
-        background: linear-gradient(145deg, #F5F7FA, #E8ECEF);
+        background: var(--grad-surface);
         color: var(--ocean-blue);
         box-shadow: 
             6px 6px 12px var(--shadow-dark),
             -6px -6px 12px var(--shadow-light);
     }
     
-    .neuro-button-secondary:hover {
-        box-shadow: 
-            8px 8px 16px var(--shadow-dark),
-            -8px -8px 16px var(--shadow-light);
+    .neuro-button-secondary::after {
+        box-shadow: var(--shadow-neuro-out);
     }
     
     /* ==================== SIDEBAR ==================== */
@@ -350,30 +405,26 @@ def get_modern_ui_css():
     
     /* ==================== METRICS ==================== */
     .metric-card {
-        background: linear-gradient(145deg, #FFFFFF, #F5F7FA);
+        background: var(--grad-surface-light);
         border-radius: 20px;
         padding: 24px;
         text-align: center;
-        box-shadow: 
-            8px 8px 16px var(--shadow-dark),
-            -8px -8px 16px var(--shadow-light);
-        transition: all 0.3s ease;
+        box-shadow: var(--shadow-neuro-out);
+        position: relative;
+        transition: transform 0.3s ease;
+        will-change: transform;
     }
     
     .metric-card:hover {
         transform: translateY(-4px);
-        box-shadow: 
-            12px 12px 24px var(--shadow-dark),
-            -12px -12px 24px var(--shadow-light);
+    }
+    
+    .metric-card::after {
+        box-shadow: var(--shadow-neuro-lg);
     }
     
     .metric-value {
         font-size: 2.5em;
-        font-weight: 700;
-        background: linear-gradient(135deg, var(--ocean-blue), var(--sky-blue));
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        background-clip: text;
     }
     
     .metric-label {
@@ -388,12 +439,10 @@ def get_modern_ui_css():
     /* ==================== TABS ==================== */
     .stTabs [data-baseweb="tab-list"] {
         gap: 8px;
-        background: linear-gradient(145deg, #F5F7FA, #E8ECEF);
+        background: var(--grad-surface);
         padding: 8px;
         border-radius: 20px;
-        box-shadow: 
-            inset 4px 4px 8px var(--shadow-dark),
-            inset -4px -4px 8px var(--shadow-light);
+        box-shadow: var(--shadow-neuro-in);
     }
     
     .stTabs [data-baseweb="tab"] {
@@ -406,7 +455,7 @@ def get_modern_ui_css():
     }
     
     .stTabs [aria-selected="true"] {
-        background: linear-gradient(135deg, var(--ocean-blue), var(--sky-blue));
+        background: var(--grad-primary);
         color: white;
         box-shadow: 
             4px 4px 8px rgba(0, 122, 167, 0.3),
@@ -415,7 +464,7 @@ def get_modern_ui_css():
     
     /* ==================== EXPANDER ==================== */
     .streamlit-expanderHeader {
-        background: linear-gradient(145deg, #F5F7FA, #E8ECEF);
+        background: var(--grad-surface);
         border-radius: 16px;
         padding: 16px 20px;
         font-weight: 500;
@@ -428,24 +477,20 @@ def get_modern_ui_css():
     /* ==================== FORM INPUTS ==================== */
     .stTextInput input,
     .stTextArea textarea {
-        background: linear-gradient(145deg, #FFFFFF, #F5F7FA);
+        background: var(--grad-surface-light);
         border: 1px solid rgba(0, 122, 167, 0.15);
         border-radius: 14px;
         padding: 14px 18px;
         color: var(--deep-ocean);
         font-weight: 400;
-        box-shadow: 
-            inset 3px 3px 6px var(--shadow-dark),
-            inset -3px -3px 6px var(--shadow-light);
+        box-shadow: var(--shadow-neuro-in-sm);
         transition: all 0.3s ease;
     }
     
     .stTextInput input:focus,
     .stTextArea textarea:focus {
         border-color: var(--sky-blue);
-        box-shadow: 
-            inset 3px 3px 6px var(--shadow-dark),
-            inset -3px -3px 6px var(--shadow-light),
+        box-shadow: var(--shadow-neuro-in-sm),
             0 0 0 3px rgba(0, 168, 232, 0.1);
     }
     
@@ -475,8 +520,10 @@ def get_modern_ui_css():
     }
     
     /* ==================== UTILITY CLASSES ==================== */
+    /* Gradient text, shared with .metric-value */
+    .metric-value,
     .text-gradient {
-        background: linear-gradient(135deg, var(--ocean-blue), var(--sky-blue));
+        background: var(--grad-primary);
         -webkit-background-clip: text;
         -webkit-text-fill-color: transparent;
         background-clip: text;
@@ -485,14 +532,12 @@ def get_modern_ui_css():
     
     .glass-effect {
         background: rgba(255, 255, 255, 0.2);
-        backdrop-filter: blur(20px);
+        backdrop-filter: blur(8px);
         border: 1px solid rgba(255, 255, 255, 0.3);
     }
     
     .shadow-soft {
-        box-shadow: 
-            8px 8px 16px var(--shadow-dark),
-            -8px -8px 16px var(--shadow-light);
+        box-shadow: var(--shadow-neuro-out);
     }
     
     /* ==================== RESPONSIVE ==================== */
@@ -511,3 +556,59 @@ def get_modern_ui_css():
     }
     </style>
     """
+
+_MODERN_UI_CSS = _minify_css(_MODERN_UI_CSS)
+
+
+# Animates .message-wrapper elements only as they enter the viewport.
+# Runs inside a components.html iframe and reaches the app through
+# window.parent; one observer is shared across reruns.
+_MESSAGE_REVEAL_SCRIPT = """
+    <script>
+    (function () {
+        const doc = window.parent.document;
+        if (window.parent.__messageReveal) {
+            window.parent.__messageReveal.scan();
+            return;
+        }
+        const io = new window.parent.IntersectionObserver(function (entries) {
+            entries.forEach(function (entry) {
+                if (entry.isIntersecting) {
+                    entry.target.classList.add('slide-in');
+                    io.unobserve(entry.target);
+                }
+            });
+        });
+        function scan() {
+            doc.querySelectorAll('.message-wrapper:not([data-reveal])').forEach(function (el) {
+                el.setAttribute('data-reveal', '');
+                io.observe(el);
+            });
+        }
+        new window.parent.MutationObserver(scan).observe(doc.body, {childList: true, subtree: true});
+        window.parent.__messageReveal = {scan: scan};
+        scan();
+    })();
+    </script>
+    """
+
+
+def get_modern_ui_css():
+    """Returns comprehensive CSS for modern neumorphic UI"""
+    return _MODERN_UI_CSS
+
+
+def get_message_reveal_script():
+    """Returns the scroll-in animation script (render with components.html, height=0)"""
+    return _MESSAGE_REVEAL_SCRIPT
+
+
+def inject_modern_ui():
+    """
+    Inject the modern UI CSS together with the message reveal script
+
+    Messages only animate once the script adds .slide-in, so the two are
+    always rendered together; call this on every rerun.
+    """
+    st.markdown(_MODERN_UI_CSS, unsafe_allow_html=True)
+    components.html(_MESSAGE_REVEAL_SCRIPT, height=0)
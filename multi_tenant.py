@@ -4,11 +4,46 @@ Allows multiple communities/organizations to manage their own spaces securely.
 """
 
 from firebase_admin import db
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 from typing import Dict, List, Optional
+import copy
 import uuid
 import hashlib
 import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ttl_cache import TTLCache
+
+
+# Membership lookups, keyed by (org_id, username)
+MEMBERSHIP_CACHE_TTL_SECONDS = 30
+MEMBERSHIP_CACHE_MAXSIZE = 4096
+_membership_cache = TTLCache(MEMBERSHIP_CACHE_MAXSIZE)  # {(org_id, username): (is_member, role, is_admin)}
+
+# Organization documents, shared by the access checks within a render
+ORG_CACHE_TTL_SECONDS = 10
+ORG_CACHE_MAXSIZE = 1024
+_org_cache = TTLCache(ORG_CACHE_MAXSIZE)  # {org_id: org}
+
+# Fan-out for reading several organizations at once
+_org_fetch_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="org-read")
+
+# user_organizations (and the members maps) are only trusted once
+# migrations/user_organizations holds _USER_ORG_INDEX_VERSION; version 2
+# added the legacy members list -> map conversion
+_USER_ORG_INDEX_MARKER = 'migrations/user_organizations'
+_USER_ORG_INDEX_VERSION = 2
+_user_org_index_ready = False
+_user_org_index_lock = threading.Lock()
+
+# Actions each member role may perform
+_ROLE_PERMISSIONS = {
+    "admin": {"read", "write", "delete", "admin", "moderate"},
+    "moderator": {"read", "write", "moderate"},
+    "member": {"read", "write"}
+}
 
 
 # ============================================================
@@ -37,13 +72,14 @@ def create_organization(
         settings = {}
     
     org_id = org_name.lower().replace(" ", "_")
+    now_iso = datetime.now(timezone.utc).isoformat()
     
     organization = {
         "id": org_id,
         "name": org_name,
         "description": description,
         "admin": admin_username,
-        "members": [admin_username],
+        "members": {admin_username: True},
         "settings": {
             "is_private": settings.get("is_private", False),
             "require_approval": settings.get("require_approval", True),
@@ -56,19 +92,24 @@ def create_organization(
                 "analytics": True
             })
         },
-        "created_at": datetime.now().isoformat(),
-        "updated_at": datetime.now().isoformat()
+        "created_at": now_iso,
+        "updated_at": now_iso
     }
     
     try:
         ref = db.reference(f'organizations/{org_id}')
-        existing = ref.get()
+        existing = ref.get(shallow=True)
         
         if existing:
             print(f"⚠️ Organization {org_name} already exists")
             return None
         
-        ref.set(organization)
+        # Organization plus the admin's user_organizations entry in one write
+        db.reference().update({
+            f'organizations/{org_id}': organization,
+            f'user_organizations/{admin_username}/{org_id}': True
+        })
+        _invalidate_membership(org_id)
         print(f"✅ Organization created: {org_name}")
         return org_id
     except Exception as e:
@@ -87,6 +128,22 @@ def get_organization(org_id: str) -> Optional[Dict]:
         return None
 
 
+def _get_org_cached(org_id: str) -> Optional[Dict]:
+    """
+    get_organization() behind an ORG_CACHE_TTL_SECONDS cache.
+    Missing organizations and failed reads are not cached. Callers get
+    their own copy, so mutating it never touches the cached entry.
+    """
+    org = _org_cache.get(org_id)
+    if org is not None:
+        return copy.deepcopy(org)
+    
+    org = get_organization(org_id)
+    if org:
+        _org_cache.set(org_id, copy.deepcopy(org), ORG_CACHE_TTL_SECONDS)
+    return org
+
+
 def list_organizations() -> List[Dict]:
     """List all organizations."""
     try:
@@ -116,8 +173,9 @@ def update_organization_settings(org_id: str, settings: Dict) -> bool:
         
         ref.update({
             "settings": current_settings,
-            "updated_at": datetime.now().isoformat()
+            "updated_at": datetime.now(timezone.utc).isoformat()
         })
+        _invalidate_membership(org_id)
         
         print(f"✅ Organization settings updated: {org_id}")
         return True
@@ -130,6 +188,92 @@ def update_organization_settings(org_id: str, settings: Dict) -> bool:
 # Member Management & Access Control
 # ============================================================
 
+def _member_names(members) -> set:
+    """Usernames in a members node: a {username: true} map, or a legacy list."""
+    if isinstance(members, list):
+        return {name for name in members if isinstance(name, str)}
+    if isinstance(members, dict):
+        # Legacy list entries show up as {"0": username, ...} once mixed with map keys
+        return {
+            value if isinstance(value, str) else name
+            for name, value in members.items()
+            if value is True or isinstance(value, str)
+        }
+    return set()
+
+
+def _read(path: str):
+    """Blocking RTDB read, suitable for submitting to _org_fetch_executor."""
+    return db.reference(path).get()
+
+
+def _members_migrated() -> bool:
+    """Apply the one-time membership migration if needed; False if it could not run."""
+    try:
+        _ensure_user_org_index()
+        return True
+    except Exception as e:
+        print(f"⚠️ Membership migration not applied yet: {e}")
+        return False
+
+
+def _member_flag(org_id: str, username: str, migrated: Optional[bool] = None) -> bool:
+    """
+    Check whether `username` is in organizations/{org_id}/members (read-only).
+    
+    Once _ensure_user_org_index has rewritten legacy member lists as maps
+    this is a single-key read; if the migration could not run, the whole
+    members node is read and either format is understood.
+    """
+    if migrated is None:
+        migrated = _members_migrated()
+    members_path = f'organizations/{org_id}/members'
+    if migrated:
+        return _read(f'{members_path}/{username}') is not None
+    return username in _member_names(_read(members_path))
+
+
+def _membership(org_id: str, username: str) -> tuple:
+    """
+    Return (is_member, role, is_admin) for a user from single-key reads
+    issued in parallel (one round trip), repeated at most once per
+    MEMBERSHIP_CACHE_TTL_SECONDS. Never writes.
+    Raises on Firebase errors; failed lookups are not cached.
+    """
+    key = (org_id, username)
+    cached = _membership_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    migrated = _members_migrated()
+    admin_f = _org_fetch_executor.submit(_read, f'organizations/{org_id}/admin')
+    member_f = _org_fetch_executor.submit(_read, f'organization_members/{org_id}/{username}')
+    flag_f = _org_fetch_executor.submit(_member_flag, org_id, username, migrated)
+    admin, member, flag = admin_f.result(), member_f.result(), flag_f.result()
+    
+    # Every organization has an admin, so a missing one means no organization
+    if admin is None:
+        result = (False, None, False)
+    else:
+        result = (
+            flag,
+            member.get("role", "member") if member else None,
+            admin == username
+        )
+    
+    _membership_cache.set(key, result, MEMBERSHIP_CACHE_TTL_SECONDS)
+    return result
+
+
+def _invalidate_membership(org_id: str, username: str = None):
+    """Drop the cached org and cached membership for one user (or all of them)."""
+    _org_cache.pop(org_id, None)
+    if username is not None:
+        _membership_cache.pop((org_id, username), None)
+        return
+    _membership_cache.pop_matching(lambda key: key[0] == org_id)
+
+
 def add_member_to_organization(org_id: str, username: str, role: str = "member") -> bool:
     """
     Add a member to an organization.
@@ -143,29 +287,26 @@ def add_member_to_organization(org_id: str, username: str, role: str = "member")
         Success status
     """
     try:
-        org_ref = db.reference(f'organizations/{org_id}')
-        org = org_ref.get()
-        
-        if not org:
+        if db.reference(f'organizations/{org_id}/admin').get() is None:
             print(f"⚠️ Organization {org_id} not found")
             return False
         
-        members = org.get("members", [])
-        
-        if username in members:
+        if _member_flag(org_id, username):
             print(f"⚠️ User {username} already a member of {org_id}")
             return False
         
-        members.append(username)
-        org_ref.update({"members": members})
-        
-        # Store member role
-        member_ref = db.reference(f'organization_members/{org_id}/{username}')
-        member_ref.set({
-            "username": username,
-            "role": role,
-            "joined_at": datetime.now().isoformat()
+        # Membership flag, member role and both reverse indexes in one write
+        db.reference().update({
+            f'organizations/{org_id}/members/{username}': True,
+            f'organization_members/{org_id}/{username}': {
+                "username": username,
+                "role": role,
+                "joined_at": datetime.now(timezone.utc).isoformat()
+            },
+            f'user_roles/{username}/{org_id}': role,
+            f'user_organizations/{username}/{org_id}': True
         })
+        _invalidate_membership(org_id, username)
         
         print(f"✅ Added {username} to {org_id} as {role}")
         return True
@@ -177,28 +318,27 @@ def add_member_to_organization(org_id: str, username: str, role: str = "member")
 def remove_member_from_organization(org_id: str, username: str) -> bool:
     """Remove a member from an organization."""
     try:
-        org_ref = db.reference(f'organizations/{org_id}')
-        org = org_ref.get()
+        admin = db.reference(f'organizations/{org_id}/admin').get()
         
-        if not org:
+        if admin is None:
             return False
         
-        members = org.get("members", [])
-        
-        if username not in members:
+        if not _member_flag(org_id, username):
             return False
         
         # Don't allow removing the admin
-        if username == org.get("admin"):
+        if username == admin:
             print(f"⚠️ Cannot remove admin from organization")
             return False
         
-        members.remove(username)
-        org_ref.update({"members": members})
-        
-        # Remove member role
-        member_ref = db.reference(f'organization_members/{org_id}/{username}')
-        member_ref.delete()
+        # Membership flag, member role and both reverse indexes in one write
+        db.reference().update({
+            f'organizations/{org_id}/members/{username}': None,
+            f'organization_members/{org_id}/{username}': None,
+            f'user_roles/{username}/{org_id}': None,
+            f'user_organizations/{username}/{org_id}': None
+        })
+        _invalidate_membership(org_id, username)
         
         print(f"✅ Removed {username} from {org_id}")
         return True
@@ -210,13 +350,7 @@ def remove_member_from_organization(org_id: str, username: str) -> bool:
 def get_member_role(org_id: str, username: str) -> Optional[str]:
     """Get a member's role in an organization."""
     try:
-        ref = db.reference(f'organization_members/{org_id}/{username}')
-        member = ref.get()
-        
-        if member:
-            return member.get("role", "member")
-        
-        return None
+        return _membership(org_id, username)[1]
     except Exception as e:
         print(f"❌ Error getting member role: {e}")
         return None
@@ -225,14 +359,7 @@ def get_member_role(org_id: str, username: str) -> Optional[str]:
 def is_member(org_id: str, username: str) -> bool:
     """Check if a user is a member of an organization."""
     try:
-        org_ref = db.reference(f'organizations/{org_id}')
-        org = org_ref.get()
-        
-        if not org:
-            return False
-        
-        members = org.get("members", [])
-        return username in members
+        return _membership(org_id, username)[0]
     except Exception as e:
         print(f"❌ Error checking membership: {e}")
         return False
@@ -241,34 +368,63 @@ def is_member(org_id: str, username: str) -> bool:
 def is_admin(org_id: str, username: str) -> bool:
     """Check if a user is an admin of an organization."""
     try:
-        org_ref = db.reference(f'organizations/{org_id}')
-        org = org_ref.get()
-        
-        if not org:
-            return False
-        
-        return org.get("admin") == username
+        return _membership(org_id, username)[2]
     except Exception as e:
         print(f"❌ Error checking admin status: {e}")
         return False
 
 
+def _ensure_user_org_index():
+    """
+    One-time membership migration, then set the migration marker:
+    rewrite legacy members lists as {username: true} maps and backfill
+    user_organizations for every member of every organization.
+    
+    Writes made before the marker (create/add) only add single entries,
+    so a node's existence never means it is complete. The conversion only
+    deletes legacy slots and sets flags, so re-running it is harmless.
+    """
+    global _user_org_index_ready
+    if _user_org_index_ready:
+        return
+    with _user_org_index_lock:
+        if _user_org_index_ready:
+            return
+        if (db.reference(_USER_ORG_INDEX_MARKER).get() or 0) < _USER_ORG_INDEX_VERSION:
+            all_orgs = db.reference('organizations').get() or {}
+            updates = {}
+            for org_id, org in all_orgs.items():
+                members = org.get("members")
+                members_path = f'organizations/{org_id}/members'
+                legacy_keys = range(len(members)) if isinstance(members, list) else [
+                    key for key, value in (members or {}).items() if isinstance(value, str)
+                ]
+                for key in legacy_keys:
+                    updates[f'{members_path}/{key}'] = None
+                for name in _member_names(members):
+                    if legacy_keys:
+                        updates[f'{members_path}/{name}'] = True
+                    updates[f'user_organizations/{name}/{org_id}'] = True
+            updates[_USER_ORG_INDEX_MARKER] = _USER_ORG_INDEX_VERSION
+            db.reference().update(updates)
+            _org_cache.clear()
+        _user_org_index_ready = True
+
+
 def get_user_organizations(username: str) -> List[Dict]:
-    """Get all organizations a user is a member of."""
+    """
+    Get all organizations a user is a member of.
+    
+    Reads the user_organizations/{username} index (backfilled once for
+    memberships that predate it, see _ensure_user_org_index).
+    """
     try:
-        orgs_ref = db.reference('organizations')
-        all_orgs = orgs_ref.get()
-        
-        if not all_orgs:
-            return []
-        
-        user_orgs = []
-        for org in all_orgs.values():
-            members = org.get("members", [])
-            if username in members:
-                user_orgs.append(org)
+        _ensure_user_org_index()
+        org_ids = db.reference(f'user_organizations/{username}').get(shallow=True) or {}
         
-        return user_orgs
+        # One read per org, issued concurrently
+        orgs = _org_fetch_executor.map(_get_org_cached, list(org_ids))
+        return [org for org in orgs if org]
     except Exception as e:
         print(f"❌ Error getting user organizations: {e}")
         return []
@@ -290,25 +446,17 @@ def check_permission(org_id: str, username: str, action: str) -> bool:
     Returns:
         True if user has permission
     """
-    # Check if user is a member
-    if not is_member(org_id, username):
+    # Membership and role come from one cached lookup
+    try:
+        member, role, _ = _membership(org_id, username)
+    except Exception as e:
+        print(f"❌ Error checking permission: {e}")
         return False
     
-    # Get user role
-    role = get_member_role(org_id, username)
-    
-    if not role:
+    if not member or not role:
         return False
     
-    # Define permissions by role
-    permissions = {
-        "admin": ["read", "write", "delete", "admin", "moderate"],
-        "moderator": ["read", "write", "moderate"],
-        "member": ["read", "write"]
-    }
-    
-    allowed_actions = permissions.get(role, [])
-    return action in allowed_actions
+    return action in _ROLE_PERMISSIONS.get(role, ())
 
 
 def create_invite_code(org_id: str, created_by: str, max_uses: int = 1, expires_in_days: int = 7) -> str:
@@ -325,6 +473,7 @@ def create_invite_code(org_id: str, created_by: str, max_uses: int = 1, expires_
         Invite code
     """
     code = secrets.token_urlsafe(16)
+    now = datetime.now(timezone.utc)
     
     invite = {
         "code": code,
@@ -332,8 +481,8 @@ def create_invite_code(org_id: str, created_by: str, max_uses: int = 1, expires_
         "created_by": created_by,
         "max_uses": max_uses,
         "uses": 0,
-        "expires_at": (datetime.now() + timedelta(days=expires_in_days)).isoformat(),
-        "created_at": datetime.now().isoformat()
+        "expires_at": int(now.timestamp()) + expires_in_days * 24 * 60 * 60,  # epoch seconds
+        "created_at": now.isoformat()
     }
     
     try:
@@ -359,38 +508,72 @@ def use_invite_code(code: str, username: str) -> bool:
     """
     try:
         ref = db.reference(f'invite_codes/{code}')
-        invite = ref.get()
-        
-        if not invite:
-            print(f"⚠️ Invalid invite code")
-            return False
-        
-        # Check expiration
-        expires_at = datetime.fromisoformat(invite["expires_at"])
-        if datetime.now() > expires_at:
-            print(f"⚠️ Invite code expired")
-            return False
         
-        # Check max uses
-        if invite["uses"] >= invite["max_uses"]:
-            print(f"⚠️ Invite code already used maximum times")
+        # Validate and claim a use in one transaction (a conditional write
+        # against the invite's ETag), so concurrent joins can't exceed
+        # max_uses. It may retry, so the last attempt's verdict wins.
+        verdict = {"error": "⚠️ Invalid invite code", "org_id": None}
+        
+        def _claim(invite):
+            verdict["org_id"] = None
+            if not invite:
+                verdict["error"] = "⚠️ Invalid invite code"
+                return invite
+            
+            # Epoch seconds; invites created before that change stored a local ISO string
+            expires_at = invite.get("expires_at")
+            if isinstance(expires_at, str):
+                expired = datetime.now() > datetime.fromisoformat(expires_at)
+            else:
+                expired = expires_at is None or time.time() > expires_at
+            if expired:
+                verdict["error"] = "⚠️ Invite code expired"
+                return invite
+            
+            if invite.get("uses", 0) >= invite.get("max_uses", 1):
+                verdict["error"] = "⚠️ Invite code already used maximum times"
+                return invite
+            
+            verdict["org_id"] = invite["org_id"]
+            return {**invite, "uses": invite.get("uses", 0) + 1}
+        
+        ref.transaction(_claim)
+        
+        if verdict["org_id"] is None:
+            print(verdict["error"])
             return False
         
-        # Add member to organization
-        org_id = invite["org_id"]
-        success = add_member_to_organization(org_id, username, role="member")
-        
-        if success:
-            # Increment uses
-            ref.update({"uses": invite["uses"] + 1})
+        # Add member to organization, handing the use back if that fails
+        if add_member_to_organization(verdict["org_id"], username, role="member"):
             return True
         
+        ref.child('uses').transaction(lambda uses: max((uses or 1) - 1, 0))
         return False
     except Exception as e:
         print(f"❌ Error using invite code: {e}")
         return False
 
 
+def purge_expired_invites() -> int:
+    """
+    Delete every invite whose numeric `expires_at` has passed.
+    
+    Uses the `expires_at` index so only expired codes are returned.
+    
+    Returns:
+        Number of invites deleted
+    """
+    try:
+        ref = db.reference('invite_codes')
+        expired = ref.order_by_child('expires_at').end_at(int(time.time())).get() or {}
+        if expired:
+            ref.update({code: None for code in expired})
+        return len(expired)
+    except Exception as e:
+        print(f"❌ Error purging invite codes: {e}")
+        return 0
+
+
 # ============================================================
 # Data Isolation
 # ============================================================
@@ -429,7 +612,7 @@ def verify_data_access(org_id: str, username: str, data_type: str, action: str =
         True if access is allowed
     """
     # Check if organization exists
-    org = get_organization(org_id)
+    org = _get_org_cached(org_id)
     if not org:
         return False
     
@@ -7,8 +7,14 @@ based on their profile, activity, and interests.
 from firebase_admin import db
 from datetime import datetime
 from typing import List, Dict, Optional
+import hashlib
+import heapq
+import threading
 import uuid
+from collections import OrderedDict
 from difflib import SequenceMatcher
+from analytics import opportunity_counter_updates
+from push_keys import generate_push_key
 
 
 # ============================================================
@@ -65,8 +71,11 @@ def add_opportunity(
     }
     
     try:
-        ref = db.reference(f'opportunities/{community}')
-        ref.push(opportunity)
+        # The opportunity and its counter commit together (see rebuild_counters)
+        db.reference().update({
+            f'opportunities/{community}/{generate_push_key()}': opportunity,
+            **opportunity_counter_updates(community, posted_by)
+        })
         print(f"✅ Opportunity added: {title} in {community}")
         return opportunity["id"]
     except Exception as e:
@@ -213,23 +222,103 @@ def track_user_activity(username: str, community: str, activity_type: str, conte
 # Matching Algorithm
 # ============================================================
 
-def calculate_match_score(opportunity: Dict, user_profile: Dict, user_activity: List[Dict]) -> float:
+# Recent similarity results as (ratio, exact), keyed by digests so no large
+# texts are pinned; inexact entries hold a quick_ratio() upper bound
+_SIMILARITY_CACHE_MAXSIZE = 4096
+_similarity_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_similarity_lock = threading.Lock()
+
+
+def _text_digest(text: str) -> bytes:
+    """Stable 16-byte key for a text"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _similarity_lookup(key: tuple) -> Optional[tuple]:
+    with _similarity_lock:
+        entry = _similarity_cache.get(key)
+        if entry is not None:
+            _similarity_cache.move_to_end(key)
+        return entry
+
+
+def _similarity_store(key: tuple, ratio: float, exact: bool):
+    with _similarity_lock:
+        _similarity_cache[key] = (ratio, exact)
+        _similarity_cache.move_to_end(key)
+        if len(_similarity_cache) > _SIMILARITY_CACHE_MAXSIZE:
+            _similarity_cache.popitem(last=False)
+
+
+def _text_similarity(a: str, b: str) -> float:
+    """SequenceMatcher ratio, memoized in a small LRU: reruns score the same texts again"""
+    key = (_text_digest(a), _text_digest(b))
+    entry = _similarity_lookup(key)
+    if entry is not None and entry[1]:
+        return entry[0]
+    ratio = SequenceMatcher(None, a, b).ratio()
+    _similarity_store(key, ratio, True)
+    return ratio
+
+
+def _similarity_upper_bound(a: str, b: str) -> float:
+    """
+    Upper bound on _text_similarity: any cached value (exact or bound),
+    else SequenceMatcher.quick_ratio(), which is linear time
+    """
+    key = (_text_digest(a), _text_digest(b))
+    entry = _similarity_lookup(key)
+    if entry is not None:
+        return entry[0]
+    bound = SequenceMatcher(None, a, b).quick_ratio()
+    _similarity_store(key, bound, False)
+    return bound
+
+
+def _user_features(user_profile: Dict, user_activity: List[Dict]) -> Dict:
+    """Lowercased user-side inputs to calculate_match_score, built once per user."""
+    return {
+        "skills": {skill.lower() for skill in user_profile.get("skills", [])},
+        "interests": {interest.lower() for interest in user_profile.get("interests", [])},
+        "activity_text": " ".join(act.get("content", "") for act in user_activity[-20:]).lower()
+                         if user_activity else "",
+        "bio": user_profile.get("bio", "").lower()
+    }
+
+
+def calculate_match_score(
+    opportunity: Dict,
+    user_profile: Dict,
+    user_activity: List[Dict],
+    user_features: Dict = None
+) -> float:
     """
     Calculate match score between opportunity and user.
+    Pass user_features (from _user_features) when scoring many opportunities.
     
     Returns:
         Score between 0 and 1
     """
+    if user_features is None:
+        user_features = _user_features(user_profile, user_activity)
+    return _match_score(opportunity, user_activity, user_features, _text_similarity)
+
+
+def _match_score(opportunity: Dict, user_activity: List[Dict], user_features: Dict, similarity) -> float:
+    """
+    The calculate_match_score formula with a pluggable text `similarity`.
+    Passing _similarity_upper_bound yields an upper bound on the real score.
+    """
     score = 0.0
     
     # Extract opportunity data
-    opp_tags = set([tag.lower() for tag in opportunity.get("tags", [])])
-    opp_requirements = set([req.lower() for req in opportunity.get("requirements", [])])
+    opp_tags = {tag.lower() for tag in opportunity.get("tags", [])}
+    opp_requirements = {req.lower() for req in opportunity.get("requirements", [])}
     opp_description = opportunity.get("description", "").lower()
     
     # Extract user data
-    user_skills = set([skill.lower() for skill in user_profile.get("skills", [])])
-    user_interests = set([interest.lower() for interest in user_profile.get("interests", [])])
+    user_skills = user_features["skills"]
+    user_interests = user_features["interests"]
     
     # 1. Skills match (40% weight)
     if opp_requirements:
@@ -245,14 +334,13 @@ def calculate_match_score(opportunity: Dict, user_profile: Dict, user_activity:
     
     # 3. Activity relevance (20% weight)
     if user_activity:
-        activity_texts = " ".join([act.get("content", "") for act in user_activity[-20:]]).lower()
-        activity_score = SequenceMatcher(None, activity_texts, opp_description).ratio()
+        activity_score = similarity(user_features["activity_text"], opp_description)
         score += activity_score * 0.2
     
     # 4. Bio relevance (10% weight)
-    user_bio = user_profile.get("bio", "").lower()
+    user_bio = user_features["bio"]
     if user_bio:
-        bio_score = SequenceMatcher(None, user_bio, opp_description).ratio()
+        bio_score = similarity(user_bio, opp_description)
         score += bio_score * 0.1
     
     return min(score, 1.0)
@@ -290,16 +378,35 @@ def match_opportunities(username: str, community: str, top_k: int = 5) -> List[D
     if not opportunities:
         return []
     
-    # Calculate match scores
-    scored_opportunities = []
-    for opp in opportunities:
-        score = calculate_match_score(opp, user_profile, user_activity)
-        scored_opportunities.append({
-            "opportunity": opp,
-            "match_score": round(score, 3)
-        })
+    # Calculate match scores. SequenceMatcher.ratio() dominates the cost, so
+    # opportunities are visited in order of a cheap upper bound (quick_ratio)
+    # and exact scoring stops once no remaining one can reach the top_k.
+    # Rounded bounds never fall below rounded scores, so the result is
+    # identical to scoring every opportunity.
+    features = _user_features(user_profile, user_activity)
+    bounds = sorted(
+        (
+            (-round(_match_score(opp, user_activity, features, _similarity_upper_bound), 3), position)
+            for position, opp in enumerate(opportunities)
+        )
+    )
+    
+    best = []  # min-heap of the top_k exact scores so far
+    scored = []
+    for neg_bound, position in bounds:
+        if top_k > 0 and len(best) >= top_k and -neg_bound < best[0]:
+            break
+        opp = opportunities[position]
+        score = round(calculate_match_score(opp, user_profile, user_activity, features), 3)
+        scored.append((position, {"opportunity": opp, "match_score": score}))
+        if len(best) < top_k:
+            heapq.heappush(best, score)
+        elif top_k > 0:
+            heapq.heappushpop(best, score)
     
-    # Sort by score descending
+    # Sort by score descending (ties keep their original order)
+    scored.sort(key=lambda x: x[0])
+    scored_opportunities = [entry for _, entry in scored]
     scored_opportunities.sort(key=lambda x: x["match_score"], reverse=True)
     
     return scored_opportunities[:top_k]
@@ -0,0 +1,47 @@
+"""
+Push Keys
+Client-side keys in the same format as Firebase RTDB push IDs.
+"""
+
+import random
+import threading
+import time
+from typing import List
+
+_PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+_last_push_ms = 0
+_last_push_rand: List[int] = []
+_push_key_lock = threading.Lock()
+
+
+def generate_push_key() -> str:
+    """
+    Generate a chronologically sortable key in the same format as RTDB push IDs.
+    
+    Keys made in the same millisecond reuse the previous random suffix
+    incremented by one, so they still sort in creation order.
+    """
+    global _last_push_ms, _last_push_rand
+    with _push_key_lock:
+        now_ms = int(time.time() * 1000)
+        if now_ms <= _last_push_ms:
+            # Same millisecond (or the clock stepped back): bump the suffix
+            now_ms = _last_push_ms
+            rand = _last_push_rand
+            i = 11
+            while i >= 0 and rand[i] == 63:
+                rand[i] = 0
+                i -= 1
+            if i >= 0:
+                rand[i] += 1
+        else:
+            rand = [random.randrange(64) for _ in range(12)]
+        _last_push_ms, _last_push_rand = now_ms, rand
+        random_chars = "".join(_PUSH_CHARS[r] for r in rand)
+    
+    time_chars = []
+    for _ in range(8):
+        time_chars.append(_PUSH_CHARS[now_ms % 64])
+        now_ms //= 64
+    return "".join(reversed(time_chars)) + random_chars
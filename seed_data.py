@@ -9,7 +9,8 @@ from datetime import datetime, timedelta
 from faker import Faker
 import firebase_admin
 from firebase_admin import credentials, db as firebase_db
-from auth_manager import AuthManager
+from auth_manager import AuthManager, email_index_key
+from analytics import rebuild_counters
 
 # Initialize Firebase if not already done
 if not firebase_admin._apps:
@@ -111,6 +112,7 @@ def seed_users():
         }
         
         users_ref.child(username).set(user_data)
+        firebase_db.reference(f'users_by_email/{email_index_key(email)}').set(username)
         
         # Create user profile
         profile_data = {
@@ -144,6 +146,8 @@ def seed_organizations(users):
     
     orgs_ref = firebase_db.reference('organizations')
     members_ref = firebase_db.reference('organization_members')
+    user_roles_ref = firebase_db.reference('user_roles')
+    user_orgs_ref = firebase_db.reference('user_organizations')
     
     org_names = [
         "AI Innovators Hub",
@@ -174,7 +178,7 @@ def seed_organizations(users):
             "name": org_name,
             "description": fake.text(max_nb_chars=300),
             "admin": admin,
-            "members": org_members,
+            "members": {member: True for member in org_members},
             "settings": {
                 "is_private": random.choice([True, False]),
                 "require_approval": random.choice([True, False]),
@@ -212,6 +216,8 @@ def seed_organizations(users):
             }
             
             members_ref.child(f"{org_id}/{member}").set(member_data)
+            user_roles_ref.child(f"{member}/{org_id}").set(role)
+            user_orgs_ref.child(f"{member}/{org_id}").set(True)
         
         organizations.append(org_id)
     
@@ -471,6 +477,10 @@ def seed_all_data():
         seed_analytics(users, organizations)
         seed_knowledge_base(organizations)
         
+        # Seeded data bypasses the write-time hooks, so backfill counters
+        for org_id in organizations:
+            rebuild_counters(org_id, force=True)
+        
         print("\n" + "="*60)
         print("✅ DATA SEEDING COMPLETED SUCCESSFULLY!")
         print("="*60)
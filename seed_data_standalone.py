@@ -5,11 +5,13 @@ Populates the database with realistic dummy data for testing and demo purposes
 
 import random
 import uuid
+import base64
 import bcrypt
 from datetime import datetime, timedelta
 from faker import Faker
 import firebase_admin
 from firebase_admin import credentials, db as firebase_db
+from auth_manager import BCRYPT_ROUNDS
 
 # Initialize Firebase if not already done
 if not firebase_admin._apps:
@@ -55,7 +57,7 @@ JOB_TITLES = ["Software Engineer", "Product Manager", "Data Scientist", "Busines
 
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -114,6 +116,10 @@ def seed_users():
         
         users_ref.child(username).set(user_data)
         
+        # Keep the users_by_email uniqueness index in sync
+        email_key = base64.urlsafe_b64encode(email.lower().encode('utf-8')).decode('ascii')
+        firebase_db.reference(f'users_by_email/{email_key}').set(username)
+        
         # Create user profile
         profile_data = {
             "username": username,
@@ -149,6 +155,8 @@ def seed_organizations(users):
     
     orgs_ref = firebase_db.reference('organizations')
     members_ref = firebase_db.reference('organization_members')
+    user_roles_ref = firebase_db.reference('user_roles')
+    user_orgs_ref = firebase_db.reference('user_organizations')
     
     org_names = [
         "AI Innovators Hub",
@@ -179,7 +187,7 @@ def seed_organizations(users):
             "name": org_name,
             "description": fake.text(max_nb_chars=300),
             "admin": admin,
-            "members": org_members,
+            "members": {member: True for member in org_members},
             "settings": {
                 "is_private": random.choice([True, False]),
                 "require_approval": random.choice([True, False]),
@@ -217,6 +225,8 @@ def seed_organizations(users):
             }
             
             members_ref.child(f"{org_id}/{member}").set(member_data)
+            user_roles_ref.child(f"{member}/{org_id}").set(role)
+            user_orgs_ref.child(f"{member}/{org_id}").set(True)
         
         organizations.append(org_id)
         print(f"  Created organization: {org_name} ({len(org_members)} members)")
@@ -17,8 +17,9 @@ from template_assistant import (
 )
 from analytics import (
     get_community_stats, get_top_contributors, get_engagement_trends,
-    get_user_engagement_score, generate_analytics_report
+    get_user_engagement_score, generate_analytics_report, message_counter_updates
 )
+from push_keys import generate_push_key
 from multi_tenant import (
     create_organization, get_organization, get_user_organizations,
     add_member_to_organization, create_invite_code, use_invite_code
@@ -114,17 +115,12 @@ def sidebar():
     </div>
     """, unsafe_allow_html=True)
     
-    # Get user's organizations from Firebase
+    # Get user's organizations from Firebase (user_organizations index)
     try:
-        orgs_ref = firebase_db.reference('organizations')
-        all_orgs = orgs_ref.get() or {}
-        
-        # Filter organizations where user is a member
-        user_orgs = []
-        for org_id, org_data in all_orgs.items():
-            members = org_data.get('members', {})
-            if user_name in members:
-                user_orgs.append(org_data.get('name', org_id))
+        user_orgs = [
+            org.get('name', org.get('id'))
+            for org in get_user_organizations(user_name)
+        ]
         
         # If no orgs, show default
         if not user_orgs:
@@ -795,8 +791,11 @@ elif tab_selection == "Chat":
                     
                     # Only send if there's content or a file
                     if user_input.strip() or uploaded_file is not None:
-                        chats_ref = firebase_db.reference(f'chats/{org_id}')
-                        chats_ref.push(new_msg)
+                        # The message and its counters commit together
+                        firebase_db.reference().update({
+                            f'chats/{org_id}/{generate_push_key()}': new_msg,
+                            **message_counter_updates([(org_id, new_msg.get('username', ''))])
+                        })
                         st.success("Message sent!")
                         st.rerun()
                     else:
@@ -0,0 +1,69 @@
+import time
+from unittest import mock
+
+import analytics
+
+
+class _FlakyDatabase:
+    """Stands in for firebase_admin.db: root update() fails `failures` times, then commits."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.attempts = 0
+        self.committed = {}
+
+    def reference(self, path: str = "/"):
+        return self
+
+    def update(self, values: dict):
+        self.attempts += 1
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("simulated Firebase outage")
+        self.committed.update(values)
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_failed_batch_is_retried_then_requeued():
+    database = _FlakyDatabase(failures=analytics._WRITE_FLUSH_ATTEMPTS)
+    with mock.patch.object(analytics, "db", database), \
+            mock.patch.object(analytics, "_WRITE_RETRY_BACKOFF_SECONDS", 0.01), \
+            mock.patch.object(analytics, "_WRITE_REQUEUE_DELAY_SECONDS", 0.05):
+        analytics.track_content_view("writes-test", "doc1", "kb", "alice")
+
+        # One batch: every in-place attempt fails, then the re-queued batch lands
+        assert _wait_for(lambda: "analytics/content_view_counts/writes-test/doc1" in database.committed)
+        assert database.attempts == analytics._WRITE_FLUSH_ATTEMPTS + 1
+
+        committed = database.committed
+        assert committed["analytics/content_view_counts/writes-test/doc1"] == {".sv": {"increment": 1}}
+        assert "analytics/content_viewers/writes-test/doc1/alice" in committed
+        pushed = [path for path in committed if path.startswith("analytics/content_views/writes-test/doc1/")]
+        assert len(pushed) == 1
+
+
+def test_increments_fold_into_one_update():
+    database = _FlakyDatabase(failures=0)
+    batch = [("increment", "analytics/test/folded", 1)] * 3 + [("set", "analytics/test/flag", True)]
+    with mock.patch.object(analytics, "db", database):
+        assert analytics._flush_writes(batch)
+    assert database.attempts == 1
+    assert database.committed == {
+        "analytics/test/folded": {".sv": {"increment": 3}},
+        "analytics/test/flag": True,
+    }
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
@@ -0,0 +1,158 @@
+import copy
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from unittest import mock
+
+import multi_tenant
+from multi_tenant import create_invite_code, use_invite_code, purge_expired_invites
+
+
+class _Database:
+    """Minimal in-memory stand-in for firebase_admin.db (nested dict store)."""
+
+    def __init__(self):
+        self.root = {}
+
+    def reference(self, path: str = "/"):
+        return _Reference(self, [part for part in path.split("/") if part])
+
+
+class _Reference:
+    def __init__(self, database: _Database, parts: list):
+        self.database = database
+        self.parts = parts
+
+    def child(self, path: str):
+        return _Reference(self.database, self.parts + [part for part in path.split("/") if part])
+
+    def get(self):
+        node = self.database.root
+        for part in self.parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return copy.deepcopy(node)
+
+    def set(self, value):
+        node = self.database.root
+        for part in self.parts[:-1]:
+            node = node.setdefault(part, {})
+        if value is None:
+            node.pop(self.parts[-1], None)
+        else:
+            node[self.parts[-1]] = copy.deepcopy(value)
+
+    def update(self, values: dict):
+        for path, value in values.items():
+            self.child(path).set(value)
+
+    def transaction(self, fn):
+        value = fn(self.get())
+        self.set(value)
+        return value
+
+    def order_by_child(self, key: str):
+        return _Query(self, key)
+
+
+class _Query:
+    def __init__(self, ref: _Reference, key: str):
+        self.ref = ref
+        self.key = key
+        self.end = None
+
+    def end_at(self, value):
+        self.end = value
+        return self
+
+    def get(self):
+        return {
+            name: child for name, child in (self.ref.get() or {}).items()
+            if isinstance(child.get(self.key), (int, float)) and child[self.key] <= self.end
+        }
+
+
+def _invite_env(join_succeeds: bool = True) -> tuple:
+    database = _Database()
+    joined = []
+
+    def add_member(org_id, username, role="member"):
+        joined.append((org_id, username))
+        return join_succeeds
+
+    stack = ExitStack()
+    stack.enter_context(mock.patch.object(multi_tenant, "db", database))
+    stack.enter_context(mock.patch.object(multi_tenant, "add_member_to_organization", add_member))
+    return database, joined, stack
+
+
+def _uses(database: _Database, code: str):
+    return database.reference(f"invite_codes/{code}/uses").get()
+
+
+def test_max_uses_is_enforced():
+    database, joined, stack = _invite_env()
+    with stack:
+        code = create_invite_code("org-a", "admin", max_uses=2)
+        assert use_invite_code(code, "alice")
+        assert use_invite_code(code, "bob")
+        assert not use_invite_code(code, "carol")
+        assert _uses(database, code) == 2
+        assert joined == [("org-a", "alice"), ("org-a", "bob")]
+
+
+def test_unknown_code_is_rejected():
+    database, joined, stack = _invite_env()
+    with stack:
+        assert not use_invite_code("no-such-code", "alice")
+        assert joined == []
+        assert database.reference("invite_codes/no-such-code").get() is None
+
+
+def test_expired_code_is_rejected():
+    database, joined, stack = _invite_env()
+    with stack:
+        code = create_invite_code("org-a", "admin", max_uses=5)
+        database.reference(f"invite_codes/{code}/expires_at").set(int(time.time()) - 1)
+        assert not use_invite_code(code, "alice")
+        assert _uses(database, code) == 0
+        assert joined == []
+
+
+def test_legacy_iso_expiry_is_honoured():
+    database, joined, stack = _invite_env()
+    with stack:
+        past = create_invite_code("org-a", "admin")
+        future = create_invite_code("org-a", "admin")
+        database.reference(f"invite_codes/{past}/expires_at").set((datetime.now() - timedelta(days=1)).isoformat())
+        database.reference(f"invite_codes/{future}/expires_at").set((datetime.now() + timedelta(days=1)).isoformat())
+        assert not use_invite_code(past, "alice")
+        assert use_invite_code(future, "bob")
+        assert joined == [("org-a", "bob")]
+
+
+def test_failed_join_hands_the_use_back():
+    database, joined, stack = _invite_env(join_succeeds=False)
+    with stack:
+        code = create_invite_code("org-a", "admin", max_uses=1)
+        assert not use_invite_code(code, "alice")
+        assert _uses(database, code) == 0
+
+
+def test_purge_removes_only_expired_invites():
+    database, joined, stack = _invite_env()
+    with stack:
+        live = create_invite_code("org-a", "admin")
+        stale = create_invite_code("org-a", "admin")
+        database.reference(f"invite_codes/{stale}/expires_at").set(int(time.time()) - 60)
+        assert purge_expired_invites() == 1
+        assert database.reference(f"invite_codes/{stale}").get() is None
+        assert database.reference(f"invite_codes/{live}").get() is not None
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
@@ -0,0 +1,108 @@
+import math
+import time
+from unittest import mock
+
+import kb_utils
+from kb_utils import _build_index, _index_append, _postings, search_kb, add_to_kb
+
+DOCS = [
+    "Akshat lives in Gujarat, India.",
+    "Python is used for AI, ML, and automation.",
+    "Streamlit is great for building interactive web apps.",
+    "Gujarat is a state on the western coast of India.",
+    "Firebase stores the community chat history.",
+]
+
+
+def _docs(texts):
+    return [{"id": f"doc{i}", "content": text} for i, text in enumerate(texts)]
+
+
+class _RecordingDatabase:
+    """Stands in for firebase_admin.db: root update() only records the write."""
+
+    def __init__(self):
+        self.committed = {}
+
+    def reference(self, path: str = "/"):
+        return self
+
+    def update(self, values: dict):
+        self.committed.update(values)
+
+
+def _seed(community: str, texts):
+    """Put a fresh store in the cache so search_kb doesn't reload from Firebase."""
+    kb_utils._kb_store[community] = {
+        "store": _docs(texts),
+        "loaded_at": time.monotonic(),
+        "index": None,
+    }
+
+
+def _ranking(community: str, query: str, top_k: int = 3):
+    return [r["doc"]["content"] for r in search_kb(community, query, top_k=top_k)]
+
+
+def test_tfidf_ranks_relevant_doc_first():
+    _seed("kb-rank", DOCS)
+    assert _ranking("kb-rank", "Where does Akshat live?")[0] == DOCS[0]
+    assert _ranking("kb-rank", "python automation")[0] == DOCS[1]
+
+
+def test_exact_substring_hits_rank_first():
+    _seed("kb-exact", DOCS)
+    results = search_kb("kb-exact", "gujarat", top_k=2)
+    assert [r["score"] for r in results] == [1.0, 1.0]
+    assert {r["doc"]["content"] for r in results} == {DOCS[0], DOCS[3]}
+
+
+def test_append_matches_full_rebuild_postings():
+    docs = _docs(DOCS + ["Rust is a systems language."])
+    appended = _build_index(docs[:-1])
+    _index_append(appended, docs[-1])
+    rebuilt = _build_index(docs)
+
+    assert appended["n"] == rebuilt["n"]
+    terms = set(rebuilt["postings"])
+    assert terms == set(appended["postings"]) | set(appended["pending"])
+    for term in terms:
+        doc_idx, _ = _postings(appended, term)
+        assert sorted(doc_idx.tolist()) == sorted(rebuilt["postings"][term][0].tolist())
+    assert not appended["pending"]
+
+
+def test_unseen_term_gets_rebuild_idf():
+    docs = _docs(DOCS + ["Rust is a systems language."])
+    appended = _build_index(docs[:-1])
+    _index_append(appended, docs[-1])
+    rebuilt = _build_index(docs)
+    n = len(docs)
+    assert math.isclose(appended["idf"]["rust"], math.log((1 + n) / 2) + 1.0)
+    assert math.isclose(appended["idf"]["rust"], rebuilt["idf"]["rust"])
+
+
+def test_add_to_kb_appends_in_place_and_ranks_like_rebuild():
+    _seed("kb-append", DOCS)
+    search_kb("kb-append", "warm up the index")
+    index = kb_utils._kb_store["kb-append"]["index"]
+
+    database = _RecordingDatabase()
+    with mock.patch.object(kb_utils, "db", database):
+        new_doc = add_to_kb("kb-append", "Rust is a systems language.", {"added_by": "alice"})
+
+    # Same index object, extended rather than dropped
+    assert kb_utils._kb_store["kb-append"]["index"] is index
+    assert index["n"] == len(DOCS) + 1
+    assert database.committed[f"knowledgebase/kb-append/store/{new_doc['id']}"]["content"] == new_doc["content"]
+
+    _seed("kb-rebuilt", DOCS + ["Rust is a systems language."])
+    for query in ("rust systems", "Where does Akshat live?", "web apps"):
+        assert _ranking("kb-append", query, top_k=1) == _ranking("kb-rebuilt", query, top_k=1)
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
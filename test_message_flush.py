@@ -0,0 +1,112 @@
+import time
+from contextlib import ExitStack
+from unittest import mock
+
+import db_utils
+
+
+class _FlakyDatabase:
+    """Stands in for firebase_admin.db: root update() fails `failures` times, then commits."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.attempts = 0
+        self.committed = {}
+
+    def reference(self, path: str = "/"):
+        if path.startswith("chats/"):
+            return _ChatQuery(self, path)
+        return self
+
+    def update(self, values: dict):
+        self.attempts += 1
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("simulated Firebase outage")
+        self.committed.update(values)
+
+
+class _ChatQuery:
+    """order_by_key().limit_to_last(n).get() over the committed messages of one chat."""
+
+    def __init__(self, database: _FlakyDatabase, path: str):
+        self.database = database
+        self.prefix = path + "/"
+        self.limit = None
+
+    def order_by_key(self):
+        return self
+
+    def limit_to_last(self, limit: int):
+        self.limit = limit
+        return self
+
+    def get(self):
+        rows = {
+            path[len(self.prefix):]: msg
+            for path, msg in sorted(self.database.committed.items())
+            if path.startswith(self.prefix)
+        }
+        return dict(list(rows.items())[-self.limit:]) if rows else None
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def _flaky_db_utils(failures: int) -> tuple:
+    database = _FlakyDatabase(failures)
+    stack = ExitStack()
+    stack.enter_context(mock.patch.object(db_utils, "db", database))
+    stack.enter_context(mock.patch.object(db_utils, "ensure_firebase", lambda: None))
+    stack.enter_context(mock.patch.object(db_utils, "get_user_profile", lambda username: f"id-{username}"))
+    stack.enter_context(mock.patch.object(db_utils, "_ref_cache", {}))
+    stack.enter_context(mock.patch.object(db_utils, "FLUSH_RETRY_BACKOFF_SECONDS", 0.01))
+    stack.enter_context(mock.patch.object(db_utils, "FLUSH_REQUEUE_DELAY_SECONDS", 0.2))
+    return database, stack
+
+
+def test_failed_batch_is_requeued_not_dropped():
+    database, stack = _flaky_db_utils(failures=db_utils.FLUSH_ATTEMPTS)
+    with stack:
+        key = db_utils.add_message("flush-test", "alice", "hello")
+
+        # Every in-place attempt fails; the message stays pending and readable
+        assert _wait_for(lambda: database.attempts >= db_utils.FLUSH_ATTEMPTS)
+        assert [row["content"] for row in db_utils.fetch_messages("flush-test")] == ["hello"]
+
+        # The re-queued flush commits the message and its counters together
+        assert _wait_for(lambda: f"chats/flush-test/{key}" in database.committed)
+        assert database.committed["analytics/counters/flush-test/messages"] == {".sv": {"increment": 1}}
+        assert database.committed["analytics/counters/flush-test/users/alice"] == {".sv": {"increment": 1}}
+        assert _wait_for(lambda: not db_utils._pending_rows("flush-test"))
+
+
+def test_fetch_merges_pending_in_key_order():
+    database, stack = _flaky_db_utils(failures=0)
+    with stack:
+        first = db_utils.add_message("order-test", "alice", "first")
+        assert _wait_for(lambda: f"chats/order-test/{first}" in database.committed)
+
+        database.failures = 100
+        second = db_utils.add_message("order-test", "bob", "second")
+        rows = db_utils.fetch_messages("order-test")
+        assert [row["id"] for row in rows] == [first, second]
+        assert len(db_utils.fetch_messages("order-test", limit=1)) == 1
+
+        # Let the pending write land before the patches are undone
+        database.failures = 0
+        assert _wait_for(lambda: f"chats/order-test/{second}" in database.committed)
+        assert _wait_for(lambda: not db_utils._pending_rows("order-test"))
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
@@ -0,0 +1,56 @@
+import threading
+from unittest import mock
+
+import push_keys
+from push_keys import generate_push_key, _PUSH_CHARS
+
+
+def test_format():
+    key = generate_push_key()
+    assert len(key) == 20
+    assert all(ch in _PUSH_CHARS for ch in key)
+
+
+def test_keys_sort_in_creation_order():
+    keys = [generate_push_key() for _ in range(10000)]
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+
+
+def test_same_millisecond_keys_stay_ordered():
+    with mock.patch.object(push_keys.time, "time", return_value=4102444800.0):
+        keys = [generate_push_key() for _ in range(500)]
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+
+
+def test_clock_stepping_back_keeps_order():
+    with mock.patch.object(push_keys.time, "time", return_value=4102444900.0):
+        first = generate_push_key()
+    with mock.patch.object(push_keys.time, "time", return_value=4102444800.0):
+        second = generate_push_key()
+    assert first < second
+
+
+def test_unique_across_threads():
+    keys = []
+    lock = threading.Lock()
+
+    def worker():
+        batch = [generate_push_key() for _ in range(2000)]
+        with lock:
+            keys.extend(batch)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(keys)) == len(keys)
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
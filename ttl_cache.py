@@ -0,0 +1,76 @@
+"""
+Thread-safe TTL Cache
+Small in-process cache shared by the auth, tenant, analytics and API modules.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Bounded dict cache with a per-entry expiry, guarded by a lock.
+
+    Entries are stored as (expires_at, value). When the cache is full,
+    expired entries are pruned first, then the oldest inserted ones.
+    `clock` is the time source expiries are compared against: monotonic by
+    default, time.time for caches keyed to wall-clock expiries such as a
+    JWT `exp`.
+    """
+
+    def __init__(self, maxsize: int, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries: Dict[Hashable, Tuple[float, object]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default=None):
+        """Return the live value for `key`, or `default` if missing or expired."""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= now:
+                del self._entries[key]
+                return default
+            return entry[1]
+
+    def set(self, key: Hashable, value, ttl: Optional[float] = None,
+            expires_at: Optional[float] = None):
+        """Store `value` for `ttl` seconds, or until the absolute `expires_at`."""
+        now = self.clock()
+        if expires_at is None:
+            expires_at = now + ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.maxsize:
+                for stale_key in [k for k, (exp, _) in self._entries.items() if exp <= now]:
+                    del self._entries[stale_key]
+                # Still full of live entries: drop the oldest inserted
+                while len(self._entries) >= self.maxsize:
+                    del self._entries[next(iter(self._entries))]
+            self._entries[key] = (expires_at, value)
+
+    def pop(self, key: Hashable, default=None):
+        """Remove `key`, returning its value (expired or not) or `default`."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def pop_matching(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Remove every key for which `predicate(key)` is true; returns the count."""
+        with self._lock:
+            doomed = [k for k in self._entries if predicate(k)]
+            for key in doomed:
+                del self._entries[key]
+        return len(doomed)
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)